@@ -0,0 +1,104 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import zlib
+from typing import Any, Dict, Optional
+from core.config import settings
+from core import metrics
+from core.messages import PipelineMessage
+
+# Delivered messages' stage timings are logged here when TRACE_SAMPLE_RATE is set
+tracer = logging.getLogger("trace")
+
+listener: Optional[logging.handlers.QueueListener] = None
+
+def sampled(request_id: str, rate: float) -> bool:
+    """
+    Whether a message falls in the sampled fraction `rate` of messages.
+    Decided by its message id, so a sampled message is kept at every stage and in every target language.
+    """
+    if rate >= 1.0:
+        return True
+    if rate <= 0.0 or request_id is None:
+        return False
+    message_id = str(request_id).split("-", 1)[0]
+    return zlib.crc32(message_id.encode("utf8")) / 0xFFFFFFFF < rate
+
+def describe(message: PipelineMessage, redact: bool) -> Dict[str, Any]:
+    """A message as logged: its fields, with the text and translation replaced by their lengths if `redact`"""
+    fields = message.to_dict()
+    if redact:
+        for field in ("text", "translation_text"):
+            if fields[field] is not None:
+                fields[field] = f"<{len(fields[field])} chars>"
+    return fields
+
+class MessageRecordFilter(logging.Filter):
+    """
+    Samples and redacts per-message records: those logging a PipelineMessage, or given a `request_id` extra.
+    Only LOG_SAMPLE_RATE of messages keep their records; with LOG_REDACT_TEXT, messages are logged without their text.
+    Runs before the record is formatted, so dropped records cost no formatting.
+    """
+    def filter(self, record: logging.LogRecord) -> bool:
+        args = record.args if isinstance(record.args, tuple) else ()
+        request_id = getattr(record, "request_id", None)
+        if request_id is None:
+            request_id = next((arg.id for arg in args if isinstance(arg, PipelineMessage)), None)
+            if request_id is None:
+                return True
+        if not sampled(request_id, settings.LOG_SAMPLE_RATE):
+            return False
+        if settings.LOG_REDACT_TEXT:
+            record.args = tuple(
+                describe(arg, redact=True) if isinstance(arg, PipelineMessage) else arg for arg in args
+            )
+        return True
+
+def configure_logging():
+    """
+    Send every record through one non-blocking queue handler: the caller only formats the record and enqueues it,
+    and a background thread writes it out. Levels come from LOG_LEVEL, with per-module overrides (one module per
+    pipeline stage) from LOG_LEVELS. Safe to call more than once.
+    """
+    global listener
+    if listener is not None:
+        return
+    records = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    handler.addFilter(MessageRecordFilter())
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter(settings.LOG_FORMAT))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(settings.LOG_LEVEL)
+    if settings.TRACE_SAMPLE_RATE:
+        tracer.setLevel(logging.INFO)
+    for name, level in settings.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+    listener = logging.handlers.QueueListener(records, output)
+    listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Write out the records still queued and stop the writer thread"""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+def trace(message: PipelineMessage):
+    """
+    Log the time a delivered message spent in each stage, from the stage timestamps it carries,
+    for TRACE_SAMPLE_RATE of messages: one record per message instead of one per stage.
+    """
+    if not settings.TRACE_SAMPLE_RATE or not sampled(message.id, settings.TRACE_SAMPLE_RATE):
+        return
+    ts = message.ts
+    spans = " ".join(
+        f"{stage}={(ts[end] - ts[start]) * 1000:.2f}ms"
+        for stage, (start, end) in metrics.STAGES.items() if start in ts and end in ts
+    )
+    total = (ts['delivered'] - ts['received']) * 1000 if 'received' in ts and 'delivered' in ts else float("nan")
+    tracer.info("request=%s pair=%s node=%s total=%.2fms %s",
+                message.id, metrics.pair(message), settings.NODE_ID, total, spans)
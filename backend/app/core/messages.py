@@ -0,0 +1,106 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple, Union
+import msgpack
+
+# Client wire formats, negotiated as the WebSocket subprotocol; JSON unless the client asks otherwise
+JSON = "json"
+MSGPACK = "msgpack"
+FORMATS = (JSON, MSGPACK)
+
+Payload = Union[str, bytes]
+
+class PipelineMessage:
+    """
+    One chat message (one target language of it) as it moves through the pipeline.
+    Between stages it travels as a msgpack array of its fields in FIELDS order, with no key names;
+    its client payload is encoded at most once per wire format, however many members it is sent to.
+    """
+    FIELDS = ("id", "room_id", "text", "source_lang", "target_lang", "translation_text", "correlation", "ts", "plan",
+              "segments", "segment", "error")
+    __slots__ = FIELDS + ("encoded",)
+
+    def __init__(self, id: str = None, room_id: str = None, text: str = None, source_lang: str = None,
+                 target_lang: str = None, translation_text: str = None, correlation: Dict = None, ts: Dict = None,
+                 plan: List[str] = None, segments: List[int] = None, segment: int = None, error: str = None):
+        self.id = id
+        self.room_id = room_id
+        self.text = text
+        self.source_lang = source_lang
+        self.target_lang = target_lang
+        self.translation_text = translation_text
+        self.correlation = correlation
+        self.ts = {} if ts is None else ts
+        # Languages the translation went through, e.g. ["es", "en", "fr"] for a pivot through English
+        self.plan = plan
+        # End offsets in `text` of its sentence segments, for a long text streamed segment by segment
+        self.segments = segments
+        # Index of the segment a streamed partial result carries; None for a whole message
+        self.segment = segment
+        # Why the message could not be translated, for a failed result; None otherwise
+        self.error = error
+        self.encoded: Dict[str, Payload] = {}
+
+    def for_target(self, request_id: str, target_lang: str) -> "PipelineMessage":
+        """A copy for one target language; its stage timestamps diverge from here on"""
+        return PipelineMessage(
+            request_id, self.room_id, self.text, self.source_lang, target_lang,
+            self.translation_text, self.correlation, dict(self.ts), segments=self.segments
+        )
+
+    def for_segment(self, index: int, text: str, translation_text: str) -> "PipelineMessage":
+        """A streamed partial result: the translation of segment `index`, whose source text is `text`"""
+        return PipelineMessage(
+            self.id, self.room_id, text, self.source_lang, self.target_lang, translation_text,
+            self.correlation, dict(self.ts), self.plan, self.segments, index
+        )
+
+    def pieces(self) -> List[str]:
+        """The source text of each segment"""
+        return [self.text[start:end] for start, end in zip([0] + self.segments[:-1], self.segments)]
+
+    def pack(self) -> bytes:
+        """Internal wire format, for queues and Redis"""
+        return msgpack.packb([getattr(self, field) for field in self.FIELDS])
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "PipelineMessage":
+        return cls(*msgpack.unpackb(data))
+
+    def to_dict(self) -> Dict[str, Any]:
+        frame = {field: getattr(self, field) for field in self.FIELDS}
+        if self.segments:
+            # A streamed translation arrives as "segment" frames in order, then one "complete" frame
+            frame["type"] = "complete" if self.segment is None else "segment"
+        if self.error is not None:
+            frame["type"] = "error"
+        return frame
+
+    def encode(self, fmt: str) -> Payload:
+        """Client payload in `fmt`, encoded on first use"""
+        payload = self.encoded.get(fmt)
+        if payload is None:
+            payload = self.encoded[fmt] = encode(self.to_dict(), fmt)
+        return payload
+
+    def __repr__(self) -> str:
+        return f"PipelineMessage({self.to_dict()})"
+
+def negotiate(subprotocols) -> Tuple[str, Optional[str]]:
+    """Pick the client wire format from the offered WebSocket subprotocols: (format, subprotocol to accept)"""
+    if MSGPACK in subprotocols:
+        return MSGPACK, MSGPACK
+    return JSON, JSON if JSON in subprotocols else None
+
+def encode(frame: Any, fmt: str) -> Payload:
+    """Encode a frame for a client: text for JSON, binary for msgpack"""
+    if isinstance(frame, PipelineMessage):
+        return frame.encode(fmt)
+    if fmt == MSGPACK:
+        return msgpack.packb(frame)
+    return frame if isinstance(frame, str) else json.dumps(frame)
+
+def decode(data: Payload) -> Any:
+    """Decode a client frame; binary frames are msgpack, text frames JSON"""
+    if isinstance(data, (bytes, bytearray)):
+        return msgpack.unpackb(data)
+    return json.loads(data)
@@ -0,0 +1,103 @@
+import time
+from prometheus_client import Counter, Gauge, Histogram
+from core.messages import PipelineMessage
+
+# Latency buckets from 0.5ms to 30s, so both the in-process stages and the inference call resolve
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+STAGE_SECONDS = Histogram(
+    "translation_stage_seconds",
+    "Time spent in each pipeline stage",
+    ["stage", "pair"],
+    buckets=LATENCY_BUCKETS,
+)
+END_TO_END_SECONDS = Histogram(
+    "translation_end_to_end_seconds",
+    "Time from WebSocket receive to delivery",
+    ["pair"],
+    buckets=LATENCY_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    "translation_batch_size",
+    "Number of messages per translation batch",
+    ["pair"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+BATCH_WAIT_SECONDS = Histogram(
+    "translation_batch_wait_seconds",
+    "Time a message waited in the micro-batcher",
+    ["pair"],
+    buckets=LATENCY_BUCKETS,
+)
+FIRST_SEGMENT_SECONDS = Histogram(
+    "translation_first_segment_seconds",
+    "Time from WebSocket receive to delivery of a streamed translation's first segment",
+    ["pair"],
+    buckets=LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge("translation_requests_in_flight", "Requests awaiting a result on this node")
+OPEN_WEBSOCKETS = Gauge("translation_open_websockets", "Open chat WebSocket connections")
+QUEUE_DEPTH = Gauge("translation_queue_depth", "Messages ready in a RabbitMQ queue", ["queue"])
+TIMEOUTS = Counter("translation_timeouts_total", "Requests that timed out waiting for a result")
+ERRORS = Counter("translation_errors_total", "Errors by pipeline stage", ["stage"])
+DETECTIONS = Counter(
+    "translation_detections_total",
+    "How each message's source language was decided: explicit, profile, detected, "
+    "profile_low_confidence or low_confidence",
+    ["outcome"],
+)
+TRANSLATION_PLANS = Counter("translation_plans_total", "Translations by plan: identity, direct or pivot", ["kind"])
+SHARED_STEPS = Counter("translation_shared_steps_total", "Translation steps served by an identical step in flight")
+CACHE_LOOKUPS = Counter("translation_cache_lookups_total", "Translation cache lookups: local_hit, shared_hit or miss", ["result"])
+CACHE_EVICTIONS = Counter("translation_cache_evictions_total", "Entries dropped from the local cache tier: size or expired", ["reason"])
+CACHE_ENTRIES = Gauge("translation_cache_entries", "Entries in the local translation cache tier")
+MODEL_LOAD_SECONDS = Histogram(
+    "translation_model_load_seconds",
+    "Time to load a local model into the model pool",
+    ["model"],
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+MODEL_POOL_BYTES = Gauge("translation_model_pool_bytes", "Local model pool memory: used or budget", ["kind"])
+MODEL_EVICTIONS = Counter("translation_model_evictions_total", "Local models evicted to stay within the memory budget")
+REJECTED = Counter("translation_rejected_total", "Messages refused by admission control", ["reason"])
+
+# Intervals between stage timestamps, observed as (histogram stage label, start mark, end mark)
+STAGES = {
+    "detection": ("detection_start", "detection_end"),
+    "detection_queue": ("detection_queued", "translation_dequeued"),
+    "translation": ("translation_start", "translation_end"),
+    "translation_queue": ("translation_queued", "store_dequeued"),
+    "store": ("store_dequeued", "stored"),
+    "delivery": ("stored", "delivered"),
+}
+
+def mark(message: PipelineMessage, stage: str, now: float = None) -> float:
+    """Record a wall-clock stage timestamp on the message; the timestamps travel with it through every queue"""
+    now = time.time() if now is None else now
+    message.ts[stage] = now
+    return now
+
+def pair(message: PipelineMessage) -> str:
+    return f"{message.source_lang}-{message.target_lang}"
+
+def observe(message: PipelineMessage, stage: str):
+    """Observe the duration of `stage` if both of its timestamps are present"""
+    ts = message.ts
+    start, end = STAGES[stage]
+    if start in ts and end in ts:
+        STAGE_SECONDS.labels(stage, pair(message)).observe(max(0.0, ts[end] - ts[start]))
+
+def observe_delivery(message: PipelineMessage):
+    """Observe the delivery stage and the end-to-end latency of a delivered message"""
+    observe(message, "delivery")
+    ts = message.ts
+    if 'received' in ts and 'delivered' in ts:
+        END_TO_END_SECONDS.labels(pair(message)).observe(max(0.0, ts['delivered'] - ts['received']))
+
+def observe_first_segment(message: PipelineMessage):
+    """Observe how long a streamed translation took to show its first segment"""
+    ts = message.ts
+    if 'received' in ts and 'delivered' in ts:
+        FIRST_SEGMENT_SECONDS.labels(pair(message)).observe(max(0.0, ts['delivered'] - ts['received']))
@@ -1,14 +1,66 @@
-import threading
-import json
 import asyncio
-from fastapi import FastAPI, WebSocket
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from services.processmessage import process_message as process_message_service
-from services.translation import translation_service  # ensure this runs as needed
-from services.language_detection import language_detection  # ensure this runs as needed
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from core.config import settings
+from core.logs import configure_logging
+# Before the services are imported, so their start-up records go through it too
+configure_logging()
+from core import metrics
+from core import messages
+from core.messages import PipelineMessage
+from services.processmessage import InvalidMessageError, InvalidTargetError, process_message as process_message_service
+from services.dispatcher import result_dispatcher
+from services.transport import transport
+from services.rooms import Member, room_registry
+from services.admission import admission_controller
+from services.translation import translation_service
+from services.cache import translation_cache
+from services.http_client import inference_client
+from services.language_detection import LanguageProfile, language_detection
+from typing import Set
 import uvicorn
 
-app = FastAPI(title="Real-Time Translation Network")
+logger = logging.getLogger(__name__)
+
+# Services with models to warm up, reported by /readyz
+pipeline_services = [language_detection, translation_service]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Importing the services opens no connections and loads no models; that all happens here.
+    # Connect the transport, then run the pipeline's consumers on the app's event loop.
+    await transport.start()
+    # The shared cache tier and the inference pool are async clients, so they are created on this loop.
+    translation_cache.start()
+    inference_client.start()
+    # Models warm up in the background: the process is live right away and ready once they are loaded.
+    # Started first, so the services have their worker pools before the consumers hand them messages.
+    tasks = [asyncio.create_task(service.start()) for service in pipeline_services]
+    tasks.extend([
+        asyncio.create_task(translation_service.consume()),
+        asyncio.create_task(process_message_service.consume()),
+        asyncio.create_task(process_message_service.subscribe()),
+        asyncio.create_task(process_message_service.sample_queue_depth()),
+        asyncio.create_task(transport.keep_presence()),
+    ])
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Everything started above is released, so the app can be started again (e.g. by each test client).
+        for service in pipeline_services:
+            service.close()
+        await inference_client.close()
+        await translation_cache.close()
+        # The log writer is left running: it is stopped at exit, after the app's last records
+        await transport.close()
+
+app = FastAPI(title="Real-Time Translation Network", lifespan=lifespan)
 
 # Configure CORS (adjust origins as needed)
 app.add_middleware(
@@ -19,63 +71,161 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+metrics.IN_FLIGHT.set_function(result_dispatcher.in_flight)
+
 @app.get("/")
 async def root():
     return {"message": "Real-Time Translation Network API"}
 
-@app.websocket("/ws/chat/{room_id}")
-async def websocket_endpoint(websocket: WebSocket, room_id: str):
-    await websocket.accept()
-    try:
-        while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
-            # Process the message (kick off the pipeline)
-            await process_message_service.process(message)
-            
-            # Option 1: Implement a polling mechanism with timeout if you prefer...
-            # Option 2: Or, subscribe to the Redis Pub/Sub channel and wait for the notification.
-            # For this example, we'll assume a simple polling with asyncio.sleep:
-            timeout = 1  # seconds
-            elapsed = 0
-            interval = 0.5
-            response_string = None
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "ok"}
 
-            while elapsed < timeout:
-                response_string = process_message_service.redis_client.get(message['id'])
-                if response_string:
-                    break
-                await asyncio.sleep(interval)
-                elapsed += interval
+@app.get("/readyz")
+async def readyz(response: Response):
+    """Readiness: brokers connected and models warm"""
+    checks = {"transport": await transport.is_ready()}
+    for service in pipeline_services:
+        checks[type(service).__name__] = service.ready
+    ready = all(checks.values())
+    if not ready:
+        response.status_code = 503
+    return {"ready": ready, "checks": checks}
 
-            if not response_string:
-                await websocket.send_text("Processing timed out")
-            else:
-                response = json.loads(response_string)
-                await websocket.send_text(json.dumps(response))
-    except Exception as e:
-        print(f"Error in websocket: {e}")
-    finally:
-        await websocket.close()
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
-def start_translation_consumer():
-    translation_service.consume()
+async def notify_sender(room_id: str, sender: Member, language: str, request_id: str,
+                        requested_langs: Set[str] = frozenset()):
+    """
+    Wait for one target language's translation on behalf of its sender.
+    Room members get translations from the delivery path; the sender is only sent one here if they asked for a
+    language they do not read, or told if it timed out.
+    """
+    try:
+        # The dispatcher pushes the result, so several messages can be in flight per connection.
+        response = await result_dispatcher.wait(request_id, settings.RESULT_TIMEOUT)
+    except asyncio.TimeoutError:
+        metrics.TIMEOUTS.inc()
+        await room_registry.send(room_id, [sender], "Processing timed out")
+        return
+    if language in requested_langs and sender.language != language:
+        await room_registry.send(room_id, [sender], response)
 
-def start_processmessage_consumer():
-    process_message_service.consume()
+@app.websocket("/ws/chat/{room_id}")
+async def websocket_endpoint(websocket: WebSocket, room_id: str, lang: str = settings.DEFAULT_TARGET_LANG,
+                             since: str = None):
+    # JSON unless the client offers the msgpack subprotocol
+    fmt, subprotocol = messages.negotiate(websocket.scope.get('subprotocols', []))
+    await websocket.accept(subprotocol=subprotocol)
+    if not process_message_service.reachable(lang):
+        # Nothing could be translated into the language this member reads
+        payload = messages.encode(InvalidTargetError("unsupported_language", [lang]).reply(), fmt)
+        if isinstance(payload, bytes):
+            await websocket.send_bytes(payload)
+        else:
+            await websocket.send_text(payload)
+        await websocket.close(code=1008)
+        return
+    metrics.OPEN_WEBSOCKETS.inc()
+    member = None
+    profile = LanguageProfile()
+    # Sender's wait task -> the request id it waits for
+    waiting = {}
 
-def start_redis_subscriber():
-    # Run the subscribe method in a separate thread to listen for published messages.
-    process_message_service.subscribe()
+    async def handle(frame: dict):
+        if not isinstance(frame, dict):
+            await room_registry.send(room_id, [member], InvalidMessageError("invalid_frame").reply())
+            return
+        if frame.get('type') == 'set_language':
+            language = frame.get('lang')
+            if isinstance(language, str) and process_message_service.reachable(language):
+                await room_registry.set_language(room_id, member, language)
+            else:
+                await room_registry.send(room_id, [member], InvalidTargetError("unsupported_language", [language]).reply())
+            return
+        client_msg_id = frame.get('client_msg_id')
+        try:
+            text = process_message_service.message_text(frame.get('text'))
+            # target_lang may name one language or a list of them
+            requested_langs = process_message_service.requested_languages(frame.get('target_lang'))
+        except InvalidMessageError as e:
+            await room_registry.send(room_id, [member], e.reply(client_msg_id))
+            return
+        # An explicit source_lang skips language detection
+        message = PipelineMessage(room_id=room_id, text=text, source_lang=frame.get('source_lang'))
+        metrics.mark(message, 'received')
+        rejection = admission_controller.admit(member.id, room_id, result_dispatcher.in_flight())
+        if rejection is not None:
+            # Refuse fast rather than queue work that cannot be served in time
+            await room_registry.send(room_id, [member], rejection.reply(client_msg_id))
+            return
+        # Translate once per distinct language read in the room, on any node, not once per recipient
+        target_langs = await room_registry.room_languages(room_id) | requested_langs
+        # Process the message (kick off the pipeline)
+        try:
+            request_ids = await process_message_service.process(message, target_langs, connection_id=member.id,
+                                                        client_msg_id=client_msg_id, profile=profile)
+        except InvalidTargetError as e:
+            await room_registry.send(room_id, [member], e.reply(client_msg_id))
+            return
+        if client_msg_id is not None:
+            # Lets a client pipelining messages map its own ids to the server's before any translation arrives
+            await room_registry.send(room_id, [member], {
+                "type": "ack",
+                "client_msg_id": client_msg_id,
+                "message_id": message.id,
+                "ids": request_ids,
+            })
+        for language, request_id in request_ids.items():
+            task = asyncio.create_task(
+                notify_sender(room_id, member, language, request_id, requested_langs)
+            )
+            waiting[task] = request_id
+            task.add_done_callback(lambda done: waiting.pop(done, None))
 
-if __name__ == "__main__":
-    # Start background consumer threads.
-    translation_thread = threading.Thread(target=start_translation_consumer, daemon=True)
-    processmessage_thread = threading.Thread(target=start_processmessage_consumer, daemon=True)
-    redis_subscriber_thread = threading.Thread(target=start_redis_subscriber, daemon=True)
-    
-    translation_thread.start()
-    processmessage_thread.start()
-    redis_subscriber_thread.start()
+    try:
+        member = await room_registry.join(room_id, websocket, lang, fmt)
+        if since:
+            # A reconnecting client passes the last request id it received and is sent what it missed
+            try:
+                for message in await transport.room_history(room_id, lang, since):
+                    await room_registry.send(room_id, [member], message)
+            except ValueError:
+                logger.warning(f"Ignoring invalid backfill cursor: {since}")
+        while True:
+            received = await websocket.receive()
+            if received['type'] == 'websocket.disconnect':
+                raise WebSocketDisconnect(received.get('code', 1000))
+            data = received.get('bytes')
+            frame = messages.decode(data if data is not None else received.get('text'))
+            # A batch frame is a list of messages
+            for item in frame if isinstance(frame, list) else [frame]:
+                await handle(item)
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        logger.exception("Error in websocket")
+        metrics.ERRORS.labels('websocket').inc()
+    finally:
+        # Only the sender's own waits are dropped; the translations still reach the rest of the room.
+        for task, request_id in list(waiting.items()):
+            task.cancel()
+            # A task cancelled before it started never reaches the dispatcher's own cleanup
+            result_dispatcher.discard(request_id)
+        metrics.OPEN_WEBSOCKETS.dec()
+        if member is not None:
+            await room_registry.leave(room_id, member)
+            admission_controller.forget_connection(member.id)
+        if not room_registry.hosts(room_id):
+            admission_controller.forget_room(room_id)
+        try:
+            await websocket.close()
+        except (RuntimeError, WebSocketDisconnect):
+            # Already closed by the client.
+            pass
 
+if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,97 @@
+import logging
+import time
+from typing import Dict, Optional
+from core.config import settings
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Allows `rate` events per second on average, in bursts of up to `burst`"""
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, now: float = None) -> float:
+        """Take a token; returns 0.0 if one was available, otherwise the seconds until one will be"""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+class Rejection:
+    """Why a message was not admitted, and when the client may retry"""
+    __slots__ = ("reason", "retry_after")
+
+    def __init__(self, reason: str, retry_after: float):
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def reply(self, client_msg_id=None) -> Dict:
+        """The structured "busy" frame sent back to the client"""
+        return {
+            "type": "busy",
+            "reason": self.reason,
+            "retry_after": round(self.retry_after, 3),
+            "client_msg_id": client_msg_id,
+        }
+
+class AdmissionController:
+    """
+    Decides, before a message enters the pipeline, whether this node can serve it in time.
+    Checks, cheapest and most global first: queue depth (shed while a pipeline queue is backed up),
+    the node's in-flight translations, then a token bucket per connection and per room. The connection's
+    bucket is checked first, so a flooding connection's refused messages take nothing from its room's bucket.
+    A limit of 0 disables its check. Room buckets are per node.
+    """
+    def __init__(self):
+        self.connections: Dict[str, TokenBucket] = {}
+        self.rooms: Dict[str, TokenBucket] = {}
+        self.queue_depths: Dict[str, int] = {}
+
+    def update_queue_depth(self, queue: str, depth: int):
+        self.queue_depths[queue] = depth
+
+    def admit(self, connection_id: str, room_id: str, in_flight: int) -> Optional[Rejection]:
+        """Return None to admit a message, or the Rejection to reply with"""
+        rejection = self.check(connection_id, room_id, in_flight)
+        if rejection is not None:
+            metrics.REJECTED.labels(rejection.reason).inc()
+        return rejection
+
+    def check(self, connection_id: str, room_id: str, in_flight: int) -> Optional[Rejection]:
+        if settings.MAX_QUEUE_DEPTH and any(depth > settings.MAX_QUEUE_DEPTH for depth in self.queue_depths.values()):
+            # Depths are only refreshed every METRICS_QUEUE_SAMPLE_SECONDS
+            return Rejection("queue_depth", settings.METRICS_QUEUE_SAMPLE_SECONDS)
+        if settings.MAX_IN_FLIGHT and in_flight >= settings.MAX_IN_FLIGHT:
+            return Rejection("in_flight", settings.RESULT_TIMEOUT / 10)
+        now = time.monotonic()
+        if settings.CONNECTION_RATE:
+            bucket = self.connections.get(connection_id)
+            if bucket is None:
+                bucket = self.connections[connection_id] = TokenBucket(settings.CONNECTION_RATE, settings.CONNECTION_BURST)
+            wait = bucket.take(now)
+            if wait:
+                return Rejection("connection_rate", wait)
+        if settings.ROOM_RATE:
+            bucket = self.rooms.get(room_id)
+            if bucket is None:
+                bucket = self.rooms[room_id] = TokenBucket(settings.ROOM_RATE, settings.ROOM_BURST)
+            wait = bucket.take(now)
+            if wait:
+                return Rejection("room_rate", wait)
+        return None
+
+    def forget_connection(self, connection_id: str):
+        self.connections.pop(connection_id, None)
+
+    def forget_room(self, room_id: str):
+        self.rooms.pop(room_id, None)
+
+# Create global instance
+admission_controller = AdmissionController()
@@ -0,0 +1,224 @@
+import logging
+import time
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from itertools import permutations
+from typing import Dict, Iterable, List, Tuple
+from core.config import settings
+from core import metrics
+from services.http_client import inference_client
+
+logger = logging.getLogger(__name__)
+
+def supported_pairs() -> List[Tuple[str, str]]:
+    """Every ordered pair of settings.SUPPORTED_LANGUAGES with a direct model"""
+    return [pair for pair in permutations(settings.SUPPORTED_LANGUAGES, 2) if has_model(*pair)]
+
+def has_model(source_lang: str, target_lang: str) -> bool:
+    return f"{source_lang}-{target_lang}" in settings.AVAILABLE_LANGUAGES
+
+def translation_path(source_lang: str, target_lang: str) -> List[str]:
+    """
+    Languages a text goes through from source to target: [source] when they match, [source, target] for a
+    direct model, otherwise [source, PIVOT_LANGUAGE, target]. Raises ValueError if no path exists.
+    """
+    if source_lang == target_lang:
+        return [source_lang]
+    if has_model(source_lang, target_lang):
+        return [source_lang, target_lang]
+    pivot = settings.PIVOT_LANGUAGE
+    if has_model(source_lang, pivot) and has_model(pivot, target_lang):
+        return [source_lang, pivot, target_lang]
+    raise ValueError(f"No translation path from {source_lang} to {target_lang}")
+
+class TranslationBackend(ABC):
+    """Interface every translation backend implements"""
+    name = "base"
+    # Whether batches go to `atranslate_batch` on the event loop; otherwise `translate_batch` runs on the worker pool
+    asynchronous = False
+
+    @abstractmethod
+    def model_id(self, source_lang: str, target_lang: str) -> str:
+        """Identifier of the model serving a language pair (also used in cache keys)"""
+
+    @abstractmethod
+    def translate_batch(self, texts: List[str], source_lang: str, target_lang: str) -> List[str]:
+        """Translate many texts for one language pair, returning translations in input order"""
+
+    async def atranslate_batch(self, texts: List[str], source_lang: str, target_lang: str) -> List[str]:
+        """Async variant of `translate_batch`, implemented by backends with `asynchronous` set"""
+        raise NotImplementedError(f"{self.name} backend is not asynchronous")
+
+    def warmup(self, pairs: Iterable[Tuple[str, str]]):
+        """Prepare the models for the given pairs ahead of traffic"""
+
+    def close(self):
+        """Release any resources held by the backend"""
+
+class RemoteBackend(TranslationBackend):
+    """HuggingFace hosted inference API, called through the pooled inference client"""
+    name = "remote"
+    asynchronous = True
+
+    def model_id(self, source_lang: str, target_lang: str) -> str:
+        return settings.HUGGINGFACE_MODEL_URL.format(src=source_lang, tgt=target_lang)
+
+    def translate_batch(self, texts: List[str], source_lang: str, target_lang: str) -> List[str]:
+        raise NotImplementedError("remote backend is only called through atranslate_batch")
+
+    async def atranslate_batch(self, texts: List[str], source_lang: str, target_lang: str) -> List[str]:
+        result = await inference_client.request(self.model_id(source_lang, target_lang), {"inputs": texts})
+        return [item['translation_text'] for item in result]
+
+class ModelPool:
+    """
+    Lazily loaded local seq2seq models with LRU eviction under a RAM budget.
+    The budget covers model parameters and buffers; tokenizers are small and not counted.
+    Room is made before a model is loaded, from its size at its last load or LOCAL_MODEL_SIZE_ESTIMATE_MB,
+    so peak memory stays within the budget. Loads run outside the pool lock, one at a time per model,
+    so translations on loaded models are never held up by a load.
+    Load times, memory used against the budget and evictions are exported on /metrics.
+    """
+    def __init__(self, memory_budget_mb: int):
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.models: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        # Per-model locks serializing loads, bytes reserved for loads in progress, and sizes seen at load
+        self.loading: Dict[str, threading.Lock] = {}
+        self.reserved = 0
+        self.sizes: Dict[str, int] = {}
+        self.threads_configured = False
+        metrics.MODEL_POOL_BYTES.labels('budget').set(self.memory_budget)
+
+    def configure_torch(self):
+        import torch
+        if settings.TORCH_NUM_THREADS > 0:
+            torch.set_num_threads(settings.TORCH_NUM_THREADS)
+        logger.info(f"Torch using {torch.get_num_threads()} threads.")
+        self.threads_configured = True
+
+    def load(self, model_name: str):
+        """Load a model and tokenizer on CPU, returning (model, tokenizer, size in bytes)"""
+        # Imported here so the remote and stub backends never pay for torch/transformers.
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+        if not self.threads_configured:
+            self.configure_torch()
+        logger.info(f"Loading local model {model_name}...")
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+        model.eval()
+        size = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+        return model, tokenizer, size
+
+    def get(self, model_name: str):
+        """Return (model, tokenizer) for a model, loading it and evicting least recently used models if needed"""
+        with self.lock:
+            entry = self.lookup(model_name)
+            if entry is not None:
+                return entry
+            model_lock = self.loading.setdefault(model_name, threading.Lock())
+        with model_lock:
+            with self.lock:
+                # Loaded by another thread while this one waited for the model lock
+                entry = self.lookup(model_name)
+                if entry is not None:
+                    return entry
+                estimate = self.sizes.get(model_name, settings.LOCAL_MODEL_SIZE_ESTIMATE_MB * 1024 * 1024)
+                self.evict(estimate)
+                self.reserved += estimate
+            start = time.perf_counter()
+            try:
+                model, tokenizer, size = self.load(model_name)
+            finally:
+                with self.lock:
+                    self.reserved -= estimate
+            elapsed = time.perf_counter() - start
+            metrics.MODEL_LOAD_SECONDS.labels(model_name).observe(elapsed)
+            logger.info(f"Loaded {model_name} in {elapsed:.2f}s ({size / 1024 / 1024:.0f} MB).")
+            with self.lock:
+                self.sizes[model_name] = size
+                # The estimate may have been low; trim to the real size
+                self.evict(size)
+                if size > self.memory_budget:
+                    logger.warning(f"Model {model_name} alone exceeds the memory budget; keeping it loaded anyway.")
+                self.models[model_name] = (model, tokenizer, size)
+                metrics.MODEL_POOL_BYTES.labels('used').set(self.used())
+            return model, tokenizer
+
+    def lookup(self, model_name: str):
+        """(model, tokenizer) if the model is loaded; call with the lock held"""
+        entry = self.models.get(model_name)
+        if entry is None:
+            return None
+        self.models.move_to_end(model_name)
+        return entry[0], entry[1]
+
+    def evict(self, size: int):
+        """Evict least recently used models until `size` more bytes fit; call with the lock held"""
+        while self.models and self.used() + self.reserved + size > self.memory_budget:
+            evicted, _ = self.models.popitem(last=False)
+            metrics.MODEL_EVICTIONS.inc()
+            metrics.MODEL_POOL_BYTES.labels('used').set(self.used())
+            logger.info(f"Evicted local model {evicted} to stay within the memory budget.")
+
+    def used(self) -> int:
+        return sum(entry[2] for entry in self.models.values())
+
+class LocalBackend(TranslationBackend):
+    """Helsinki-NLP opus-mt models running in-process on CPU via transformers"""
+    name = "local"
+
+    def __init__(self):
+        self.pool = ModelPool(settings.LOCAL_MODEL_MEMORY_BUDGET_MB)
+
+    def model_id(self, source_lang: str, target_lang: str) -> str:
+        return settings.LOCAL_MODEL_NAME.format(src=source_lang, tgt=target_lang)
+
+    def translate_batch(self, texts: List[str], source_lang: str, target_lang: str) -> List[str]:
+        import torch
+        model, tokenizer = self.pool.get(self.model_id(source_lang, target_lang))
+        inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True)
+        with torch.inference_mode():
+            outputs = model.generate(**inputs)
+        return tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+    def warmup(self, pairs: Iterable[Tuple[str, str]]):
+        for source_lang, target_lang in pairs:
+            try:
+                self.translate_batch(["Hello"], source_lang, target_lang)
+            except Exception as e:
+                # Not every opus-mt pair exists (e.g. es-fr); skip those.
+                logger.warning(f"Could not warm up {source_lang}-{target_lang}: {e}")
+
+    def close(self):
+        self.pool.models.clear()
+        metrics.MODEL_POOL_BYTES.labels('used').set(0)
+
+class StubBackend(TranslationBackend):
+    """Deterministic fake translations for tests and benchmarks"""
+    name = "stub"
+
+    def model_id(self, source_lang: str, target_lang: str) -> str:
+        return f"stub/{source_lang}-{target_lang}"
+
+    def translate_batch(self, texts: List[str], source_lang: str, target_lang: str) -> List[str]:
+        # Like autoregressive decoding, a batch takes as long as its longest text
+        latency_ms = settings.STUB_BACKEND_LATENCY_MS + settings.STUB_BACKEND_MS_PER_CHAR * max(map(len, texts), default=0)
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        return [f"[{target_lang}] {text}" for text in texts]
+
+BACKENDS = {
+    RemoteBackend.name: RemoteBackend,
+    LocalBackend.name: LocalBackend,
+    StubBackend.name: StubBackend,
+}
+
+def create_backend(name: str = None) -> TranslationBackend:
+    """Build the backend named in settings.TRANSLATION_BACKEND"""
+    name = name or settings.TRANSLATION_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown translation backend '{name}', expected one of {sorted(BACKENDS)}")
+    logger.info(f"Using '{name}' translation backend.")
+    return BACKENDS[name]()
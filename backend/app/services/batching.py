@@ -0,0 +1,51 @@
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """
+    Collects pending items per key (e.g. a "{source_lang}-{target_lang}" model key).
+    A key's batch is released when it reaches `max_batch_size` items or when its oldest item
+    has waited `max_wait` seconds. The batcher does no scheduling of its own: the owner calls
+    `pop_due` from its event loop, using `next_deadline` to know when.
+    Batch sizes and the time items waited are recorded in metrics per key.
+    """
+    def __init__(self, max_batch_size: int, max_wait: float):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.pending: Dict[str, List[Tuple[Any, float]]] = {}
+
+    def add(self, key: str, item: Any) -> Optional[List[Any]]:
+        """Queue an item, returning the key's batch if it is now full"""
+        batch = self.pending.setdefault(key, [])
+        batch.append((item, time.monotonic()))
+        if len(batch) >= self.max_batch_size:
+            return self.release(key)
+        return None
+
+    def release(self, key: str) -> List[Any]:
+        batch = self.pending.pop(key, [])
+        now = time.monotonic()
+        metrics.BATCH_SIZE.labels(key).observe(len(batch))
+        for _, enqueued_at in batch:
+            metrics.BATCH_WAIT_SECONDS.labels(key).observe(now - enqueued_at)
+        return [item for item, _ in batch]
+
+    def pop_due(self) -> List[Tuple[str, List[Any]]]:
+        """Release every batch whose oldest item has waited at least `max_wait`"""
+        now = time.monotonic()
+        due = [key for key, batch in self.pending.items() if now - batch[0][1] >= self.max_wait]
+        return [(key, self.release(key)) for key in due]
+
+    def next_deadline(self) -> Optional[float]:
+        """Seconds until the next batch becomes due, or None if nothing is pending"""
+        if not self.pending:
+            return None
+        oldest = min(batch[0][1] for batch in self.pending.values())
+        return max(0.0, oldest + self.max_wait - time.monotonic())
+
+    def __len__(self) -> int:
+        return sum(len(batch) for batch in self.pending.values())
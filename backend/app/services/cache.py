@@ -0,0 +1,143 @@
+import logging
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import redis
+import redis.asyncio as aioredis
+from core.config import settings
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """Thread-safe in-process LRU cache bounded by entry count, with per-entry TTL"""
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                metrics.CACHE_EVICTIONS.labels('expired').inc()
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                metrics.CACHE_EVICTIONS.labels('size').inc()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+class TranslationCache:
+    """
+    Two-tier translation cache.
+    Tier one is a bounded in-process LRU, tier two is a Redis hash per entry shared by all nodes.
+    Entries are keyed on (normalized text, source_lang, target_lang, model id), so swapping a model
+    never serves translations produced by the previous one.
+    Lookups, evictions and the local tier's size are exported on /metrics for sizing the cache.
+    Concurrent misses for one text are collapsed before they get here, by TranslationService's in-flight steps.
+    The shared tier's client is async and belongs to the app's event loop: it is set up by `start` and
+    released by `close`, both called from the app's lifespan.
+    """
+    def __init__(self):
+        self.local = LRUCache(settings.TRANSLATION_CACHE_SIZE, settings.TRANSLATION_CACHE_TTL)
+        metrics.CACHE_ENTRIES.set_function(lambda: len(self.local))
+        self.redis_client: Optional[aioredis.Redis] = None
+
+    def start(self):
+        """Setup Redis connection for the shared tier (none with the in-process transport)."""
+        if settings.TRANSPORT == "memory" or self.redis_client is not None:
+            return
+        try:
+            self.redis_client = aioredis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB
+            )
+        except Exception as e:
+            logger.error(f"Failed to setup Redis for translation cache: {e}")
+            raise
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalize text so trivially different inputs share a cache entry"""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    def make_key(self, text: str, source_lang: str, target_lang: str, model_id: str) -> str:
+        digest = hashlib.sha1(
+            "\0".join((model_id, source_lang, target_lang, self.normalize(text))).encode("utf8")
+        ).hexdigest()
+        return f"{settings.TRANSLATION_CACHE_PREFIX}:{source_lang}-{target_lang}:{digest}"
+
+    def get_local(self, key: str) -> Optional[str]:
+        """Look a key up in the local tier only; a miss is counted by the `get_many` that follows it"""
+        value = self.local.get(key)
+        if value is not None:
+            metrics.CACHE_LOOKUPS.labels('local_hit').inc()
+        return value
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        """Look keys up in the local tier, then the local misses in the shared tier with one round trip"""
+        values = [self.local.get(key) for key in keys]
+        metrics.CACHE_LOOKUPS.labels('local_hit').inc(sum(value is not None for value in values))
+        shared = [index for index, value in enumerate(values) if value is None]
+        if shared and self.redis_client is not None:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for index in shared:
+                    pipe.hget(keys[index], "translation")
+                found = await pipe.execute()
+            except redis.RedisError as e:
+                logger.warning(f"Translation cache Redis lookup failed: {e}")
+                found = [None] * len(shared)
+            for index, value in zip(shared, found):
+                if value is not None:
+                    values[index] = value.decode()
+                    metrics.CACHE_LOOKUPS.labels('shared_hit').inc()
+                    self.local.set(keys[index], values[index])
+        metrics.CACHE_LOOKUPS.labels('miss').inc(sum(value is None for value in values))
+        return values
+
+    async def set_many(self, entries: Dict[str, str], model_id: str):
+        """Store translations by key in both tiers"""
+        for key, value in entries.items():
+            self.local.set(key, value)
+        if self.redis_client is None or not entries:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, value in entries.items():
+                pipe.hset(key, mapping={"translation": value, "model": model_id})
+                pipe.expire(key, settings.TRANSLATION_CACHE_REDIS_TTL)
+            await pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Translation cache Redis write failed: {e}")
+
+    async def close(self):
+        """Close the shared tier's connections; the local tier is kept"""
+        if self.redis_client is not None:
+            await self.redis_client.aclose()
+            self.redis_client = None
+
+# Create global instance
+translation_cache = TranslationCache()
@@ -0,0 +1,56 @@
+import logging
+import asyncio
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+class ResultDispatcher:
+    """
+    Per-process registry of in-flight requests.
+    Each request id maps to an asyncio future that is completed as soon as its
+    translation result lands, so WebSocket handlers await the result instead of polling Redis.
+    """
+    def __init__(self):
+        self.pending: Dict[str, asyncio.Future] = {}
+
+    def register(self, request_id) -> asyncio.Future:
+        """Create the future for a request. Must be called from the event loop."""
+        future = asyncio.get_running_loop().create_future()
+        self.pending[str(request_id)] = future
+        return future
+
+    def resolve(self, request_id, result: Any):
+        """
+        Complete the future for a request with its result; called from the app's event loop.
+        Results of requests not registered here (sent from another node, or already timed out) are ignored.
+        """
+        # Left registered until `wait` or `discard` removes it, so a result may land before its waiter arrives
+        future = self.pending.get(str(request_id))
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    async def wait(self, request_id, timeout: float) -> Any:
+        """Wait for the result of a registered request, raising asyncio.TimeoutError after `timeout` seconds."""
+        key = str(request_id)
+        future = self.pending.get(key)
+        if future is None:
+            raise KeyError(f"Request ID {request_id} is not registered")
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(key, None)
+
+    def discard(self, request_id):
+        """Forget a request, e.g. when its connection is closed."""
+        future = self.pending.pop(str(request_id), None)
+        if future is not None and not future.done():
+            future.cancel()
+
+    def is_pending(self, request_id) -> bool:
+        return str(request_id) in self.pending
+
+    def in_flight(self) -> int:
+        return len(self.pending)
+
+# Create global instance
+result_dispatcher = ResultDispatcher()
@@ -0,0 +1,166 @@
+import logging
+import time
+import random
+import asyncio
+from typing import Any, Dict, Optional
+import httpx
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 503}
+
+class CircuitOpenError(Exception):
+    """Raised when the upstream is considered down and calls fail fast"""
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast for `reset_timeout` seconds.
+    After that a single trial call is let through (half-open); its outcome closes or re-opens the circuit.
+    """
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def record_abandoned(self):
+        """A call ended without telling anything about the upstream (e.g. cancelled); a trial may be retried"""
+        self.trial_in_flight = False
+
+class InferenceClient:
+    """
+    Long-lived pooled async HTTP client for the inference API.
+    The keep-alive pool, the per-model concurrency semaphores and the circuit breakers belong to the app's
+    event loop: `start` and `close` are called from the app's lifespan.
+    """
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def start(self):
+        """Create the connection pool (idempotent)"""
+        if self.client is not None:
+            return
+        http2 = settings.INFERENCE_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("INFERENCE_HTTP2 is set but the 'h2' package is missing; using HTTP/1.1.")
+                http2 = False
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.INFERENCE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.INFERENCE_MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(settings.INFERENCE_TIMEOUT, connect=settings.INFERENCE_CONNECT_TIMEOUT),
+            headers={"Authorization": f"Bearer {settings.HUGGINGFACE_TOKEN}"} if settings.HUGGINGFACE_TOKEN else None,
+        )
+        logger.info(f"Inference HTTP client ready (http2={http2}).")
+
+    def backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After and HF's estimated model load time"""
+        delay = random.uniform(0, min(settings.INFERENCE_BACKOFF_MAX, settings.INFERENCE_BACKOFF_BASE * 2 ** attempt))
+        if response is not None:
+            hint = response.headers.get("Retry-After")
+            if hint is None and response.status_code == 503:
+                try:
+                    hint = response.json().get("estimated_time")
+                except ValueError:
+                    hint = None
+            try:
+                delay = max(delay, float(hint)) if hint is not None else delay
+            except ValueError:
+                pass
+        return min(delay, settings.INFERENCE_BACKOFF_MAX)
+
+    async def request(self, url: str, payload: Dict[str, Any]) -> Any:
+        """POST a JSON payload and return the decoded JSON response, with a concurrency limit, retries and circuit breaking"""
+        self.start()
+        breaker = self.breakers.setdefault(
+            url, CircuitBreaker(settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_RESET_SECONDS)
+        )
+        semaphore = self.semaphores.setdefault(url, asyncio.Semaphore(settings.INFERENCE_CONCURRENCY_PER_MODEL))
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {url}")
+
+        # Whether the upstream answered; recorded however the call ends, so a half-open trial never stays in flight
+        upstream_up = None
+        try:
+            attempt = 0
+            while True:
+                response = None
+                try:
+                    async with semaphore:
+                        response = await self.client.post(url, json=payload)
+                except httpx.TransportError as e:
+                    error = e
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        # Other 5xx count against the upstream; 4xx mean the upstream is up but the request is bad.
+                        upstream_up = response.status_code < 500
+                        response.raise_for_status()
+                        return response.json()
+                    error = httpx.HTTPStatusError(
+                        f"Upstream returned {response.status_code}", request=response.request, response=response
+                    )
+
+                if attempt >= settings.INFERENCE_MAX_RETRIES:
+                    upstream_up = False
+                    logger.error(f"Inference call to {url} failed after {attempt + 1} attempts: {error}")
+                    raise error
+                delay = self.backoff(attempt, response)
+                logger.warning(f"Inference call to {url} failed ({error}), retrying in {delay:.2f}s.")
+                attempt += 1
+                await asyncio.sleep(delay)
+        finally:
+            if upstream_up is None:
+                breaker.record_abandoned()
+            elif upstream_up:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+
+    async def close(self):
+        """Close the connection pool and forget the per-model state"""
+        if self.client is None:
+            return
+        await self.client.aclose()
+        self.client = None
+        self.semaphores.clear()
+        self.breakers.clear()
+
+# Create global instance
+inference_client = InferenceClient()
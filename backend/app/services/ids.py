@@ -0,0 +1,61 @@
+import logging
+import time
+import zlib
+import threading
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Snowflake layout: 41 bits of milliseconds since EPOCH_MS, 10 bits of worker id, 12 bits of sequence
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+class IdGenerator:
+    """
+    Snowflake-style request ids: unique across nodes as long as worker ids differ, and strictly increasing
+    within a node, so ids sort by creation time. Up to 4096 ids per millisecond per node.
+    Ids are returned as decimal strings; 64-bit integers do not survive JSON in JavaScript clients.
+    """
+    def __init__(self, worker_id: int):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"Worker id must be between 0 and {MAX_WORKER_ID}, got {worker_id}")
+        self.worker_id = worker_id
+        self.last_ms = -1
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def next_id(self) -> str:
+        with self.lock:
+            # Never step back, even if the wall clock does
+            now = max(int(time.time() * 1000) - EPOCH_MS, self.last_ms)
+            if now == self.last_ms:
+                self.sequence = (self.sequence + 1) & MAX_SEQUENCE
+                if self.sequence == 0:
+                    # Sequence exhausted for this millisecond; borrow the next one
+                    now += 1
+            else:
+                self.sequence = 0
+            self.last_ms = now
+            return str((now << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self.sequence)
+
+    @staticmethod
+    def parse(request_id: str) -> dict:
+        """Split an id into its creation time (unix ms), worker id and sequence"""
+        value = int(request_id)
+        return {
+            "timestamp_ms": (value >> (WORKER_BITS + SEQUENCE_BITS)) + EPOCH_MS,
+            "worker_id": (value >> SEQUENCE_BITS) & MAX_WORKER_ID,
+            "sequence": value & MAX_SEQUENCE,
+        }
+
+def worker_id_for(node_id: str) -> int:
+    """settings.WORKER_ID if set, else a hash of the node id (set WORKER_ID explicitly to rule out collisions)"""
+    if settings.WORKER_ID >= 0:
+        return settings.WORKER_ID
+    return zlib.crc32(node_id.encode("utf8")) & MAX_WORKER_ID
+
+# Create global instance
+id_generator = IdGenerator(worker_id_for(settings.NODE_ID))
@@ -0,0 +1,81 @@
+import logging
+import threading
+from collections import defaultdict
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from langid.langid import LanguageIdentifier, model
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class LanguageClassifier:
+    """
+    Shared langid classifier.
+    The langid model is decoded once, restricted to the supported languages and reused by every caller.
+    """
+    def __init__(self, languages: Optional[Sequence[str]] = None):
+        self.languages = list(languages) if languages is not None else list(settings.SUPPORTED_LANGUAGES)
+        self.identifier = None
+        self.lock = threading.Lock()
+
+    def get_identifier(self) -> LanguageIdentifier:
+        """Build the langid identifier on first use and return the shared instance"""
+        if self.identifier is None:
+            with self.lock:
+                if self.identifier is None:
+                    logger.info("Loading langid model...")
+                    identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
+                    known = [lang for lang in self.languages if lang in identifier.nb_classes]
+                    unknown = set(self.languages) - set(known)
+                    if unknown:
+                        logger.warning(f"Languages not known to langid, ignoring: {sorted(unknown)}")
+                    if known:
+                        identifier.set_languages(known)
+                    self.identifier = identifier
+                    logger.info(f"Langid model loaded with candidates: {identifier.nb_classes}")
+        return self.identifier
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        """Classify a single text, returning (language, confidence)"""
+        return self.get_identifier().classify(text.lower())
+
+    def features(self, texts: Sequence[str]) -> np.ndarray:
+        """Map many texts into one (len(texts), num_features) feature matrix"""
+        identifier = self.get_identifier()
+        nextmove = identifier.tk_nextmove
+        output = identifier.tk_output
+        fv = np.zeros((len(texts), identifier.nb_numfeats), dtype=np.float32)
+        for row, text in enumerate(texts):
+            # Count the number of times we enter each state, as langid's instance2fv does
+            state = 0
+            statecount = defaultdict(int)
+            for letter in text.lower().encode('utf8'):
+                state = nextmove[(state << 8) + letter]
+                statecount[state] += 1
+            for state, count in statecount.items():
+                for index in output.get(state, ()):
+                    fv[row, index] += count
+        return fv
+
+    def classify_batch(self, texts: Sequence[str]) -> List[Tuple[str, float]]:
+        """
+        Classify many texts with a single matrix multiply.
+        :return: One (language, confidence) pair per text, in input order
+        """
+        if not texts:
+            return []
+        identifier = self.get_identifier()
+        # Log-probability of every document in every candidate class
+        pd = self.features(texts) @ identifier.nb_ptc + identifier.nb_pc
+        # Normalise each row into a probability distribution (log-sum-exp)
+        pd = pd - pd.max(axis=1, keepdims=True)
+        probs = np.exp(pd)
+        probs /= probs.sum(axis=1, keepdims=True)
+        best = probs.argmax(axis=1)
+        return [
+            (str(identifier.nb_classes[cl]), float(probs[row, cl]))
+            for row, cl in enumerate(best)
+        ]
+
+# Create global instance
+language_classifier = LanguageClassifier()
@@ -1,111 +1,187 @@
 import logging
-import pika.exceptions
-from transformers import pipeline
+import asyncio
 # from langdetect import detect_langs, DetectorFactory
-from langid.langid import LanguageIdentifier, model
+from services.language_classifier import language_classifier
 from utils.utils import utility_service
 from core.config import settings
-import pika
-from typing import Dict
-import json
+from core import metrics
+from core.messages import PipelineMessage
+from services.transport import transport
+from services.batching import MicroBatcher
+from typing import Dict, List, Optional, Tuple, Union
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class LanguageProfile:
+    """
+    The language a connection writes in, learned from its confident detections.
+    Scores decay with every sample, so a user who switches language is followed within a few messages.
+    """
+    def __init__(self):
+        self.scores: Dict[str, float] = {}
+        self.samples = 0
+
+    def learn(self, language: str):
+        for known in self.scores:
+            self.scores[known] *= settings.PROFILE_DECAY
+        self.scores[language] = self.scores.get(language, 0.0) + 1.0
+        self.samples += 1
+
+    def language(self) -> Optional[str]:
+        """The dominant language, once there are enough samples to trust it"""
+        if self.samples < settings.PROFILE_MIN_SAMPLES:
+            return None
+        language, score = max(self.scores.items(), key=lambda item: item[1])
+        return language if score / sum(self.scores.values()) >= settings.PROFILE_MIN_SHARE else None
+
 class LanguageDetectionService:
     def __init__(self):
         logger.info("Initializing LanguageDetectionService...")
-        self.setup_rabbitmq()
-    
-    def setup_rabbitmq(self):
-        """Setup RabbitMQ connection and channel"""
-        try:
-            logger.info("Setting up RabbitMQ connection...")
-            self.connection = pika.BlockingConnection(
-                pika.URLParameters(settings.RABBITMQ_URL)
-            )
-            self.channel = self.connection.channel()
-            self.channel.queue_declare(queue=settings.DETECTION_QUEUE)
-            logger.info("RabbitMQ setup complete.")
-        except Exception as e:
-            logger.error(f"Failed to set up RabbitMQ: {e}")
-            raise
+        self.batcher = MicroBatcher(settings.DETECTION_BATCH_SIZE, settings.DETECTION_BATCH_WAIT_MS / 1000)
+        self.flush_timer = None
+        self.tasks = set()
+        self.ready = False
+
+    async def start(self):
+        """Load the langid model off the event loop, so the first messages do not wait for it"""
+        await asyncio.get_running_loop().run_in_executor(None, language_classifier.get_identifier)
+        self.ready = True
+
+    def close(self):
+        """Drop batches left over from this event loop, so the service can be started again on another"""
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        self.batcher = MicroBatcher(settings.DETECTION_BATCH_SIZE, settings.DETECTION_BATCH_WAIT_MS / 1000)
 
-    async def process(self, request: Dict):
-        """Perform the Language Detection Process"""
-        logger.info("Starting language detection process...")
+    async def process(self, request: PipelineMessage, targets: Dict[str, str], profile: LanguageProfile = None):
+        """
+        Perform the Language Detection Process
+        :param targets: Request ID of each target language to translate into
+        :param profile: The sending connection's language profile, if any
+        """
+        logger.debug("Detecting the language of %s", request)
         try:
-            text = request.get('text')
-            source_lang = self.detect(text)
-            # logger.info(f"Detected language: {source_lang}")
-            request['source_lang'] = source_lang
-            self.publish_lang(request)
-            # self.close()
+            metrics.mark(request, 'detection_start')
+            request.source_lang = await self.source_language(request, profile)
+            metrics.mark(request, 'detection_end')
+            await self.publish_lang(request, targets)
         except Exception as e:
             logger.error(f"Error during language detection process: {e}")
+            metrics.ERRORS.labels('detection').inc()
             raise
 
-    def detect(self, text: str) -> str:
-        """Detect language using lang_detect library"""
-        logger.info("Detecting language...")
+    async def source_language(self, request: PipelineMessage, profile: Optional[LanguageProfile]) -> str:
+        """
+        Work out the source language, running detection only when it adds information:
+        an explicit supported `source_lang` is trusted, and a short text from a connection with a settled
+        profile is taken to be in the profile's language. A low-confidence detection falls back to the profile.
+        """
+        if request.source_lang in settings.SUPPORTED_LANGUAGES:
+            metrics.DETECTIONS.labels('explicit').inc()
+            return request.source_lang
+        if request.source_lang:
+            logger.warning(f"Ignoring unsupported source_lang {request.source_lang!r}")
+        known = profile.language() if profile is not None else None
+        if known is not None and len(request.text or "") < settings.DETECTION_SHORT_TEXT_CHARS:
+            metrics.DETECTIONS.labels('profile').inc()
+            return known
+
+        source_lang, confidence = await self.classify(request.text)
+        if confidence >= settings.DETECTION_MIN_CONFIDENCE:
+            if profile is not None:
+                profile.learn(source_lang)
+            metrics.DETECTIONS.labels('detected').inc()
+            return source_lang
+        if known is not None:
+            metrics.DETECTIONS.labels('profile_low_confidence').inc()
+            return known
+        metrics.DETECTIONS.labels('low_confidence').inc()
+        return source_lang
+
+    async def classify(self, text: str) -> Tuple[str, float]:
+        """
+        Detect the language of one text through the micro-batcher: texts arriving together are classified
+        in one vectorized pass on the executor, since langid is CPU-bound and must stay off the event loop
+        """
+        done = asyncio.get_running_loop().create_future()
+        batch = self.batcher.add("detection", (text, done))
+        if batch is not None:
+            self.flush(batch)
+        self.schedule_flush()
+        return await done
+
+    def flush(self, batch: List[Tuple[str, asyncio.Future]]):
+        task = asyncio.create_task(self.complete(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def complete(self, batch: List[Tuple[str, asyncio.Future]]):
+        """
+        Classify a batch on the executor and hand each result to the message waiting for it.
+        If the batch fails, its texts are classified one by one, so only the text at fault fails.
+        """
+        loop = asyncio.get_running_loop()
+        texts = [text for text, _ in batch]
         try:
-            # DetectorFactory.seed = 0
-            # detected_lang = detect_langs(text)[0]
-            # parsed_lang = utility_service.extract_lang(str(detected_lang))
-            # logger.info(f"Language detected: {parsed_lang}")
-            identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
-            # identifier.classify("This is a test")
-            parsed_lang, confidence = identifier.classify(text.lower())
-            logger.info(f"Language detected: {parsed_lang} with confidence {confidence}")
-            # ('en', 0.9999999909903544) #sample answer
-            return parsed_lang
+            detected = await loop.run_in_executor(None, self.detect_batch, texts)
         except Exception as e:
-            logger.error(f"Error detecting language: {e}")
-            raise
-    
-    def publish_lang(self, request: Dict):
-        """Queue translation request in RabbitMQ"""
-        logger.info("Publishing detected language to RabbitMQ...")
-        try:
-            logger.info(f"Publish Request: {request}")
-
-            message = {
-                "id": request.get('id'),
-                "text": request.get('text'),
-                "source_lang": request.get('source_lang'),
-                "target_lang": request.get('target_lang'),
-            }
-            try:
+            if len(batch) == 1:
+                detected = [e]
+            else:
+                logger.warning(f"Detection batch of {len(batch)} failed ({e}), classifying its texts one by one")
+                detected = await loop.run_in_executor(None, self.detect_each, texts)
+        for (_, done), result in zip(batch, detected):
+            if done.done():
+                continue
+            if isinstance(result, Exception):
+                done.set_exception(result)
+            else:
+                done.set_result(result)
+
+    def flush_due(self):
+        """Timer callback: flush batches whose wait window has elapsed, then re-arm the timer"""
+        self.flush_timer = None
+        for _, batch in self.batcher.pop_due():
+            self.flush(batch)
+        self.schedule_flush()
 
-                self.channel.basic_publish(
-                    exchange='',
-                    routing_key=settings.DETECTION_QUEUE,
-                    body=json.dumps(message)
-                )
-                logger.info("Message published to Detection Queue.")
-            except pika.exceptions.AMQPError as e:
-                logger.error(f"Failed to publish message to RabbitMQ: {e}")
-                raise
-                # self.channel.basic_publish(
-                #     exchange='',
-                #     routing_key=settings.DETECTION_QUEUE,
-                #     body=json.dumps(message)
-                # )
-                # logger.info("Message published to RabbitMQ after reconnection.")
+    def schedule_flush(self):
+        deadline = self.batcher.next_deadline()
+        if deadline is not None and self.flush_timer is None:
+            self.flush_timer = asyncio.get_running_loop().call_later(deadline, self.flush_due)
 
+    def detect_batch(self, texts: List[str]) -> List[Tuple[str, float]]:
+        """Detect the language of many texts in one vectorized pass, returning (language, confidence) pairs"""
+        logger.debug("Detecting language for a batch of %d messages", len(texts))
+        try:
+            return language_classifier.classify_batch(texts)
         except Exception as e:
-            logger.error(f"Failed to publish message to RabbitMQ: {e}")
+            logger.error(f"Error detecting language batch: {e}")
             raise
-    
-    def close(self):
-        """Close RabbitMQ connection"""
-        logger.info("Closing RabbitMQ connection...")
+
+    def detect_each(self, texts: List[str]) -> List[Union[Tuple[str, float], Exception]]:
+        """Detect the language of each text on its own, returning its (language, confidence) or what it raised"""
+        detected = []
+        for text in texts:
+            try:
+                detected.append(language_classifier.classify_batch([text])[0])
+            except Exception as e:
+                detected.append(e)
+        return detected
+
+    async def publish_lang(self, request: PipelineMessage, targets: Dict[str, str]):
+        """Queue translation requests on the detection queue: one per target language"""
         try:
-            self.connection.close()
-            logger.info("RabbitMQ connection closed.")
+            logger.debug("Publishing %s for %d target language(s)", request, len(targets))
+            for target_lang, request_id in targets.items():
+                message = request.for_target(request_id, target_lang)
+                # Observed per target, like every later stage, so it is labelled with the message's pair
+                metrics.observe(message, 'detection')
+                metrics.mark(message, 'detection_queued')
+                await transport.publish(settings.DETECTION_QUEUE, message)
         except Exception as e:
-            logger.error(f"Error closing RabbitMQ connection: {e}")
+            logger.error(f"Failed to publish message to the detection queue: {e}")
             raise
 
 # Create global instance
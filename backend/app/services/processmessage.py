@@ -1,140 +1,274 @@
 import logging
-import time
-import json
-import redis
-import pika
-from typing import Dict
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Set
 import asyncio
 from core.config import settings
-from services.language_detection import language_detection
+from core import logs, metrics
+from core.messages import PipelineMessage
+from services.language_detection import LanguageProfile, language_detection
 from services.translation import translation_service
+from services.backends import translation_path
+from services.dispatcher import result_dispatcher
+from services.ids import id_generator
+from services.admission import admission_controller
+from services.transport import transport
+from services.rooms import room_registry
+from services.segmentation import segmenter
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class InvalidMessageError(ValueError):
+    """Raised for a client message that cannot be processed, before it enters the pipeline"""
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+    def reply(self, client_msg_id=None) -> Dict:
+        """The "error" frame sent back to the client"""
+        return {"type": "error", "reason": self.reason, "client_msg_id": client_msg_id}
+
+class InvalidTargetError(InvalidMessageError):
+    """Raised for a message asking for target languages it cannot be translated into"""
+    def __init__(self, reason: str, languages: List[Any]):
+        super().__init__(reason)
+        self.languages = languages
+
+    def reply(self, client_msg_id=None) -> Dict:
+        return {
+            "type": "error",
+            "reason": self.reason,
+            "target_lang": self.languages,
+            "client_msg_id": client_msg_id,
+        }
+
+class SegmentStreams:
+    """
+    Puts the segments of streamed translations back in order before they reach room members:
+    segments are published in order, but stages handle messages concurrently, so one can overtake another.
+    Segments arriving after their complete translation are dropped. State is kept for the latest
+    SEGMENT_STREAMS_TRACKED translations.
+    """
+    def __init__(self):
+        # Request ID -> [index of the next segment to send, segments held until then by index]
+        self.streams: OrderedDict = OrderedDict()
+
+    def state(self, request_id: str) -> list:
+        state = self.streams.get(request_id)
+        if state is None:
+            state = self.streams[request_id] = [0, {}]
+            while len(self.streams) > settings.SEGMENT_STREAMS_TRACKED:
+                self.streams.popitem(last=False)
+        return state
+
+    def ready(self, segment: PipelineMessage) -> List[PipelineMessage]:
+        """The segments that can be sent now that `segment` has arrived, in order"""
+        state = self.state(str(segment.id))
+        if segment.segment < state[0]:
+            return []
+        held = state[1]
+        held[segment.segment] = segment
+        ready = []
+        while state[0] in held:
+            ready.append(held.pop(state[0]))
+            state[0] += 1
+        return ready
+
+    def complete(self, request: PipelineMessage):
+        """The complete translation has arrived; any segment still to come is stale"""
+        state = self.state(str(request.id))
+        state[0] = len(request.segments)
+        state[1].clear()
+
 class ProcessMessageService:
     def __init__(self) -> None:
-        self.request = {}
+        self.streams = SegmentStreams()
         logger.info("Initializing ProcessMessageService")
-        self.setup_rabbitmq()
-        self.setup_redis()
-    
-    def setup_rabbitmq(self):
-        """Setup RabbitMQ connection and channel."""
-        try:
-            logger.info("Setting up RabbitMQ connection")
-            self.connection = pika.BlockingConnection(
-                pika.URLParameters(settings.RABBITMQ_URL)
-            )
-            self.channel = self.connection.channel()
-            self.channel.queue_declare(queue=settings.TRANSLATION_QUEUE)
-            logger.info("RabbitMQ setup completed")
-        except Exception as e:
-            logger.error(f"Failed to setup RabbitMQ: {e}")
-            raise
 
-    def setup_redis(self):
-        """Setup Redis connection."""
-        try:
-            logger.info("Setting up Redis connection")
-            pool = redis.ConnectionPool(
-                host=settings.REDIS_HOST,
-                port=settings.REDIS_PORT,
-                db=settings.REDIS_DB
-            )
-            self.redis_client = redis.Redis(connection_pool=pool)
-            logger.info("Redis setup completed")
-        except Exception as e:
-            logger.error(f"Failed to setup Redis: {e}")
-            raise
-    
-    async def process(self, request: Dict):
+    @staticmethod
+    def message_text(text: Any) -> str:
+        """The text of a client frame; raises InvalidMessageError unless it is a non-blank string"""
+        if not isinstance(text, str) or not text.strip():
+            raise InvalidMessageError("invalid_text")
+        return text
+
+    @staticmethod
+    def requested_languages(requested: Any) -> Set[str]:
+        """
+        The target languages a client frame asks for: one language or a list of at most MAX_TARGET_LANGS.
+        Raises InvalidTargetError for anything else.
+        """
+        if not requested:
+            return set()
+        languages = [requested] if isinstance(requested, str) else requested
+        if not isinstance(languages, list) or not all(isinstance(language, str) for language in languages):
+            raise InvalidTargetError("invalid_target", [requested])
+        if len(set(languages)) > settings.MAX_TARGET_LANGS:
+            raise InvalidTargetError("too_many_targets", sorted(set(languages)))
+        return set(languages)
+
+    @staticmethod
+    def reachable(target_lang: str, source_lang: str = None) -> bool:
+        """
+        Whether a translation path leads to `target_lang` from `source_lang`, or, while the source is still to be
+        detected, from any supported language
+        """
+        sources = [source_lang] if source_lang in settings.SUPPORTED_LANGUAGES else settings.SUPPORTED_LANGUAGES
+        for source in sources:
+            try:
+                translation_path(source, target_lang)
+                return True
+            except ValueError:
+                continue
+        return False
+
+    async def process(self, request: PipelineMessage, target_langs: Iterable[str] = None,
+                      connection_id: str = None, client_msg_id=None,
+                      profile: LanguageProfile = None) -> Dict[str, str]:
         """
         Perform the message processing.
         Here the language_detection service is called, which (in your flow) eventually triggers translation.
+        The message is translated once per distinct target language; each translation is registered with
+        the result dispatcher before the message enters the pipeline, so the caller can await it with
+        `result_dispatcher.wait`.
+        :param target_langs: Languages to translate into (defaults to the request's `target_lang`)
+        :param connection_id: The sending connection, recorded in the correlation metadata
+        :param client_msg_id: The client's own id for the message, recorded in the correlation metadata
+        :param profile: The sending connection's language profile, used and trained by language detection
+        Long texts are split into sentence segments here, which are translated and streamed one by one.
+        :return: The request ID of each target language's translation
+        :raises InvalidTargetError: if a target language cannot be reached, before anything enters the pipeline
         """
-        logger.info("Starting message processing")
+        logger.debug("Processing %s", request)
+        languages = sorted(set(target_langs or [request.target_lang or settings.DEFAULT_TARGET_LANG]))
+        unreachable = [language for language in languages if not self.reachable(language, request.source_lang)]
+        if unreachable:
+            raise InvalidTargetError("unsupported_target", unreachable)
+        targets: Dict[str, str] = {}
         try:
-            # Assign a unique ID based on the current time (or use another unique method)
-            request['id'] = round(time.time())
+            # Node-unique, time-ordered ID; the correlation metadata travels with every translation of the message
+            request.id = id_generator.next_id()
+            request.correlation = {
+                "message_id": request.id,
+                "node_id": settings.NODE_ID,
+                "connection_id": connection_id,
+                "client_msg_id": client_msg_id,
+            }
+            request.segments = segmenter.boundaries(request.text) or None
+            for language in languages:
+                targets[language] = f"{request.id}-{language}"
+                result_dispatcher.register(targets[language])
             # Kick off language detection (which triggers the further pipeline)
-            await language_detection.process(request)
+            await language_detection.process(request, targets, profile)
+            return targets
         except Exception as e:
             logger.error(f"Error during message processing: {e}")
+            for request_id in targets.values():
+                result_dispatcher.discard(request_id)
             raise
 
-    def store(self, request: Dict) -> str:
+    async def store(self, request: PipelineMessage) -> str:
         """
-        Store the translation request in Redis and publish a notification for subscribers.
+        Store the translation request and route it to every node hosting its room.
         :param request: The translation request to store
         :return: The request ID
         """
         try:
-            logger.info("Storing translation request in Redis")
-            request_id = request.get('id')
-            # Serialize the request into JSON so it can be stored and retrieved properly.
-            serialized_request = json.dumps(request)
-            self.redis_client.set(request_id, serialized_request)
-            logger.info(f"Stored request with ID: {request_id} and data: {serialized_request}")
-            
-            # Publish a message to notify subscribers that this request has been processed.
-            self.redis_client.publish('translation_channel', request_id)
-            logger.info(f"Published message to 'translation_channel' with ID: {request_id}")
-            
+            request_id = str(request.id)
+            if request.error is not None:
+                # Failed results are routed to the room like any other, but kept out of its history
+                await transport.route_result(request)
+            else:
+                metrics.mark(request, 'stored')
+                metrics.observe(request, 'store')
+                await transport.store_result(request)
+                logger.debug("Stored %s", request)
+
+            # Members on this node are served directly, without a round trip through Redis.
+            if room_registry.hosts(request.room_id):
+                await self.deliver(request)
             return request_id
         except Exception as e:
-            logger.error(f"Error storing request in Redis: {e}")
+            logger.error(f"Error storing request: {e}")
+            metrics.ERRORS.labels('store').inc()
+            raise
+
+    async def stream(self, segment: PipelineMessage):
+        """Route a streamed segment to every node hosting its room; segments are not stored"""
+        try:
+            await transport.route_result(segment)
+            if room_registry.hosts(segment.room_id):
+                await self.deliver(segment)
+        except Exception as e:
+            logger.error(f"Error streaming segment {segment.segment} of request {segment.id}: {e}")
+            metrics.ERRORS.labels('store').inc()
             raise
 
-    def consume(self):
+    async def deliver_segment(self, segment: PipelineMessage):
+        """Send a streamed segment, and any it was holding up, to the local room members reading its language"""
+        for ready in self.streams.ready(segment):
+            if ready.segment == 0:
+                metrics.mark(ready, 'delivered')
+                metrics.observe_first_segment(ready)
+            await room_registry.broadcast(ready.room_id, ready.target_lang, ready)
+
+    async def deliver(self, request: PipelineMessage):
         """
-        Consume messages from the RabbitMQ translation queue.
-        When a message is received from translation, it is stored in Redis.
+        Deliver a translation to this node: wake the sender's handler if it is waiting here,
+        and send the translation to every local room member reading its target language.
         """
-        def callback(ch, method, properties, body):
-            logger.info(f"Received message from translation queue: {body}")
-            try:
-                # Assuming the body is a JSON-encoded string
-                request_data = json.loads(body.decode())
-            except Exception as e:
-                logger.error(f"Error decoding message: {e}")
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-                return
-            
-            # Store the final processed request in Redis and publish a notification.
-            self.store(request_data)
-            logger.info("Message processing and storage completed")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-
         try:
-            logger.info("Starting to consume messages from the RabbitMQ translation queue")
-            # Note: Using auto_ack=False to ensure messages are acknowledged after processing.
-            self.channel.basic_consume(queue=settings.TRANSLATION_QUEUE, on_message_callback=callback, auto_ack=False)
-            logger.info("Waiting for messages...")
-            self.channel.start_consuming()
+            if request.segment is not None:
+                return await self.deliver_segment(request)
+            if request.segments:
+                self.streams.complete(request)
+            result_dispatcher.resolve(str(request.id), request)
+            if request.error is None:
+                metrics.mark(request, 'delivered')
+                metrics.observe_delivery(request)
+                logs.trace(request)
+            # Encoded once per wire format for all recipients
+            await room_registry.broadcast(request.room_id, request.target_lang, request)
         except Exception as e:
-            logger.error(f"Error during message consumption: {e}")
-            raise
+            logger.error(f"Error delivering request {request.id}: {e}")
+            metrics.ERRORS.labels('delivery').inc()
+
+    async def handle(self, request: PipelineMessage):
+        """Queue handler: store a translated request; it is acked once stored"""
+        logger.debug("Received message from the translation queue: %s", request)
+        if request.segment is not None:
+            await self.stream(request)
+            return
+        metrics.mark(request, 'store_dequeued')
+        metrics.observe(request, 'translation_queue')
+        # Store the final processed request and publish a notification.
+        await self.store(request)
+
+    async def consume(self):
+        """
+        Consume messages from the translation queue until cancelled.
+        When a message is received from translation, it is stored.
+        """
+        logger.info("Starting to consume messages from the translation queue")
+        await transport.consume(settings.TRANSLATION_QUEUE, self.handle)
+
+    async def sample_queue_depth(self):
+        """Update the queue depth gauges and admission control every METRICS_QUEUE_SAMPLE_SECONDS until cancelled"""
+        while True:
+            for queue in (settings.DETECTION_QUEUE, settings.TRANSLATION_QUEUE):
+                try:
+                    depth = await transport.queue_depth(queue)
+                    metrics.QUEUE_DEPTH.labels(queue).set(depth)
+                    admission_controller.update_queue_depth(queue, depth)
+                except Exception as e:
+                    logger.warning(f"Could not sample depth of queue {queue}: {e}")
+            await asyncio.sleep(settings.METRICS_QUEUE_SAMPLE_SECONDS)
 
-    def subscribe(self):
+    async def subscribe(self):
         """
-        Subscribe to the Redis Pub/Sub channel ('translation_channel') to receive notifications in real time.
-        This can be run in a separate thread or integrated into your asynchronous workflow.
+        Receive results routed to this node by the nodes that stored them, until cancelled.
+        Each one is delivered to the room members connected here.
         """
-        pubsub = self.redis_client.pubsub()
-        pubsub.subscribe('translation_channel')
-        logger.info("Subscribed to 'translation_channel'")
-        for message in pubsub.listen():
-            if message['type'] == 'message':
-                request_id = message['data'].decode()
-                logger.info(f"Received published message for request ID: {request_id}")
-                # Optionally, fetch the stored data from Redis.
-                data = self.redis_client.get(request_id)
-                if data:
-                    logger.info(f"Retrieved data for {request_id}: {data.decode()}")
-                else:
-                    logger.warning(f"No data found for request ID: {request_id}")
+        await transport.subscribe_results(self.deliver)
 
 # Initialize an instance of your process message service.
 process_message = ProcessMessageService()
@@ -0,0 +1,155 @@
+import logging
+import asyncio
+import itertools
+from typing import Any, Dict, Iterable, List, Optional, Set
+from fastapi import WebSocket
+from core import messages
+from core.config import settings
+from services.transport import transport
+
+logger = logging.getLogger(__name__)
+
+class Member:
+    """
+    A connected socket in a room, the language it reads and its negotiated wire format.
+    Frames are queued in its outbox and written by its own writer task, so a slow socket holds up no one else.
+    """
+    def __init__(self, member_id: str, websocket: WebSocket, language: str, fmt: str = messages.JSON):
+        self.id = member_id
+        self.websocket = websocket
+        self.language = language
+        self.format = fmt
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=settings.MEMBER_OUTBOX_SIZE)
+        self.writer: Optional[asyncio.Task] = None
+
+    def post(self, payload: messages.Payload) -> bool:
+        """Queue a payload for the writer; False if the member is MEMBER_OUTBOX_SIZE frames behind"""
+        try:
+            self.outbox.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def write(self):
+        """Writer task: send the queued payloads in order, until cancelled or the socket fails"""
+        while True:
+            payload = await self.outbox.get()
+            if isinstance(payload, bytes):
+                await self.websocket.send_bytes(payload)
+            else:
+                await self.websocket.send_text(payload)
+
+class RoomRegistry:
+    """
+    Per-process registry of chat rooms, their connected members and each member's preferred language.
+    Lets the pipeline translate a message once per distinct language in a room and fan the result
+    out to every member reading that language. Changes to the languages read in a room are published to
+    the transport's presence index, so other nodes translate into them and route the room's results here.
+    """
+    def __init__(self):
+        self.rooms: Dict[str, Dict[str, Member]] = {}
+        self.member_ids = itertools.count(1)
+        # Closes of dropped members' sockets in progress
+        self.tasks = set()
+
+    async def join(self, room_id: str, websocket: WebSocket, language: str, fmt: str = messages.JSON) -> Member:
+        member = Member(str(next(self.member_ids)), websocket, language, fmt)
+        member.writer = asyncio.create_task(self.write(room_id, member))
+        languages = self.languages(room_id)
+        self.rooms.setdefault(room_id, {})[member.id] = member
+        try:
+            await self.publish_languages(room_id, languages)
+        except Exception:
+            # Not joined after all: the caller has no member to leave with
+            member.writer.cancel()
+            members = self.rooms[room_id]
+            del members[member.id]
+            if not members:
+                del self.rooms[room_id]
+            raise
+        logger.info(f"Member {member.id} joined room {room_id} reading {language}")
+        return member
+
+    async def write(self, room_id: str, member: Member):
+        try:
+            await member.write()
+        except Exception as e:
+            await self.drop(room_id, member, e)
+
+    async def drop(self, room_id: str, member: Member, reason: Any):
+        """Remove a member whose socket failed or fell too far behind, and close its socket"""
+        logger.warning(f"Dropping member {member.id} from room {room_id}: {reason}")
+        await self.leave(room_id, member)
+        task = asyncio.create_task(self.close(member))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def close(self, member: Member):
+        try:
+            # 1013: try again later; the client reconnects and is backfilled
+            await member.websocket.close(code=1013)
+        except Exception:
+            # Already closed
+            pass
+
+    async def leave(self, room_id: str, member: Member):
+        if member.writer is not None and member.writer is not asyncio.current_task():
+            member.writer.cancel()
+        members = self.rooms.get(room_id)
+        if members is None or member.id not in members:
+            return
+        languages = self.languages(room_id)
+        del members[member.id]
+        if not members:
+            del self.rooms[room_id]
+        logger.info(f"Member {member.id} left room {room_id}")
+        await self.publish_languages(room_id, languages)
+
+    async def publish_languages(self, room_id: str, previous: Set[str]):
+        """Update the presence index if the languages read in a room on this node changed"""
+        languages = self.languages(room_id)
+        if languages != previous:
+            await transport.set_room_languages(room_id, languages)
+
+    def hosts(self, room_id: str) -> bool:
+        """Whether any member of the room is connected to this node"""
+        return room_id in self.rooms
+
+    async def set_language(self, room_id: str, member: Member, language: str):
+        languages = self.languages(room_id)
+        member.language = language
+        await self.publish_languages(room_id, languages)
+
+    def languages(self, room_id: str) -> Set[str]:
+        """Distinct languages read in a room by members on this node"""
+        return {member.language for member in self.rooms.get(room_id, {}).values()}
+
+    async def room_languages(self, room_id: str) -> Set[str]:
+        """Distinct languages read in a room across all nodes"""
+        return self.languages(room_id) | await transport.room_languages(room_id)
+
+    def members(self, room_id: str, language: str = None) -> List[Member]:
+        """Members of a room, optionally only those reading `language`"""
+        return [
+            member for member in self.rooms.get(room_id, {}).values()
+            if language is None or member.language == language
+        ]
+
+    async def send(self, room_id: str, members: Iterable[Member], frame: Any):
+        """
+        Queue one frame for many members, encoded once per wire format in use, without waiting for any socket;
+        members too far behind to take it are dropped from the room
+        """
+        payloads = {}
+        for member in list(members):
+            if member.format not in payloads:
+                payloads[member.format] = messages.encode(frame, member.format)
+            if not member.post(payloads[member.format]):
+                await self.drop(room_id, member, f"{settings.MEMBER_OUTBOX_SIZE} frames behind")
+
+    async def broadcast(self, room_id: str, language: str, frame: Any):
+        """Send a frame to every member of a room reading `language`"""
+        await self.send(room_id, self.members(room_id, language), frame)
+
+# Create global instance
+room_registry = RoomRegistry()
@@ -0,0 +1,36 @@
+import logging
+import re
+from typing import List
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# A sentence ends at terminal punctuation followed by whitespace; a blank line always ends one
+SENTENCE_END = re.compile(r"(?<=[.!?;。！？])\s+|\n\s*\n")
+
+class Segmenter:
+    """
+    Splits long texts into sentence segments that are translated on their own.
+    Short sentences are merged with the next one, and overlong ones are split between words,
+    so every segment stays within SEGMENT_MIN_CHARS..SEGMENT_MAX_CHARS where the text allows.
+    """
+    def boundaries(self, text: str) -> List[int]:
+        """End offsets of the segments of `text`; empty if it is too short to be worth streaming"""
+        if not text or len(text) < settings.STREAM_MIN_CHARS:
+            return []
+        ends: List[int] = []
+        start = 0
+        for cut in [match.end() for match in SENTENCE_END.finditer(text)] + [len(text)]:
+            while cut - start > settings.SEGMENT_MAX_CHARS:
+                # A space too near the start would split off a piece shorter than SEGMENT_MIN_CHARS,
+                # e.g. a short sentence held back to be merged with this one
+                space = text.rfind(" ", start + settings.SEGMENT_MIN_CHARS, start + settings.SEGMENT_MAX_CHARS)
+                start = space + 1 if space != -1 else start + settings.SEGMENT_MAX_CHARS
+                ends.append(start)
+            if cut > start and (cut - start >= settings.SEGMENT_MIN_CHARS or cut == len(text)):
+                ends.append(cut)
+                start = cut
+        return ends if len(ends) > 1 else []
+
+# Create global instance
+segmenter = Segmenter()
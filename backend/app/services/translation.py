@@ -1,138 +1,254 @@
 import logging
-# from transformers import pipeline
-import requests
+import time
 from core.config import settings
-import pika
-import json
+from core import metrics
+from core.messages import PipelineMessage
+from services.backends import create_backend, supported_pairs, translation_path
+from services.cache import translation_cache
+from services.batching import MicroBatcher
+from services.transport import transport
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import asyncio
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class TranslationService:
     def __init__(self):
         self.models = {}
-        self.request = {}
-        self.setup_rabbitmq()
+        self.batcher = MicroBatcher(settings.TRANSLATION_BATCH_SIZE, settings.TRANSLATION_BATCH_WAIT_MS / 1000)
+        self.flush_timer = None
+        self.tasks = set()
+        # (source_lang, target_lang, text) -> result of that translation step while it is in flight
+        self.steps: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        # Created by `start` and shut down by `close`, so the service can be started again
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.backend = create_backend()
+        # Nothing to warm up unless PRELOAD_MODELS is set
+        self.ready = not settings.PRELOAD_MODELS
         logger.info("TranslationService initialized.")
-    
-    def setup_rabbitmq(self):
-        """Setup RabbitMQ connection and channel"""
-        try:
-            self.connection = pika.BlockingConnection(
-                pika.URLParameters(settings.RABBITMQ_URL)
-            )
-            # Create Connection to Translation Queue
-            self.channel = self.connection.channel()
-            self.channel.queue_declare(queue=settings.TRANSLATION_QUEUE)
-            logger.info("RabbitMQ connection and channel setup completed.")
-        except Exception as e:
-            logger.error(f"Error setting up RabbitMQ: {e}")
-            raise
+
+    async def start(self):
+        """Create the worker pool, then load and warm up every supported pair on it if PRELOAD_MODELS is set"""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=settings.TRANSLATION_WORKERS, thread_name_prefix="translation")
+        if settings.PRELOAD_MODELS:
+            logger.info("Warming up translation models...")
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.backend.warmup, supported_pairs())
+        self.ready = True
 
     def get_model(self, source_lang: str = settings.DEFAULT_SOURCE_LANG, target_lang: str = settings.DEFAULT_TARGET_LANG):
-        """Get or create translation model for language pair"""
+        """Get the backend's model id for a language pair"""
         model_key = f"{source_lang}-{target_lang}"
         if model_key not in self.models:
-            model_name = settings.HUGGINGFACE_MODEL_URL.format(
-                src=source_lang,
-                tgt=target_lang
-            )
-            logger.info(f"Loading model for {model_key}: {model_name}")
-            
-            self.models[model_key] = model_name
+            model_id = self.backend.model_id(source_lang, target_lang)
+            logger.info(f"Using model for {model_key}: {model_id}")
+
+            self.models[model_key] = model_id
         return self.models[model_key]
     
-    def translate(self, text: str, source_lang: str, target_lang: str) -> str:
-        """Translate text using HuggingFace model"""
+    async def lookup(self, texts: List[str], source_lang: str, target_lang: str) -> Tuple[List[Optional[str]], Dict[str, List[int]]]:
+        """Cached translations of `texts` (None for misses), and the indexes of each distinct miss by cache key"""
+        model_id = self.get_model(source_lang, target_lang)
+        keys = [translation_cache.make_key(text, source_lang, target_lang, model_id) for text in texts]
+        if settings.TRANSLATION_CACHE_ENABLED:
+            translations = await translation_cache.get_many(keys)
+        else:
+            translations = [None] * len(texts)
+        misses: Dict[str, List[int]] = {}
+        for index, (key, cached) in enumerate(zip(keys, translations)):
+            if cached is None:
+                # Identical texts in one batch are only sent upstream once
+                misses.setdefault(key, []).append(index)
+        return translations, misses
+
+    async def store(self, translations: List[Optional[str]], misses: Dict[str, List[int]], results: List[str],
+                    source_lang: str, target_lang: str) -> List[str]:
+        """Fill the misses of a batch in with the backend's results, caching them"""
+        if settings.TRANSLATION_CACHE_ENABLED:
+            await translation_cache.set_many(dict(zip(misses, results)), self.get_model(source_lang, target_lang))
+        for key, translation in zip(misses, results):
+            for index in misses[key]:
+                translations[index] = translation
+        logger.debug("Translated batch of %d from %s to %s (%d upstream)",
+                     len(translations), source_lang, target_lang, len(misses))
+        return translations
+
+    async def translate_batch(self, texts: List[str], source_lang: str, target_lang: str) -> List[str]:
+        """
+        Translate many texts for one language pair with a single inference call for the cache misses.
+        The cache is read and written on the running loop; async backends are awaited there too,
+        blocking ones run on the worker pool.
+        """
         if source_lang == target_lang:
-            logger.info("Source and target languages are the same. Returning original text.")
-            return text
-            
-        logger.info(f"Translating text from {source_lang} to {target_lang}.")
-        model_url = self.get_model(source_lang, target_lang)
-        result = requests.post(
-            model_url,
-            headers={"Authorization": f"Bearer {settings.HUGGINGFACE_TOKEN}"},
-            json={"inputs": text}
-        )
-        # result = model(text)
-        translation = result[0]['translation_text']
-        logger.info(f"Translation completed: {translation}")
-        return translation
-    
-    def publish_translation(self):
-        """Queue translation request in RabbitMQ"""
-        message = {
-            "id": self.request.get('id'),
-            "text": self.request.get('text'),
-            "translation_text": self.request.get('translation_text'),
-            "source_lang": self.request.get('source_lang'),
-            "target_lang": self.request.get('target_lang'),
-        }
+            return list(texts)
+        translations, misses = await self.lookup(texts, source_lang, target_lang)
+        results = []
+        if misses:
+            pending = [texts[misses[key][0]] for key in misses]
+            if self.backend.asynchronous:
+                results = await self.backend.atranslate_batch(pending, source_lang, target_lang)
+            else:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self.backend.translate_batch, pending, source_lang, target_lang
+                )
+        return await self.store(translations, misses, results, source_lang, target_lang)
+
+    async def publish_translation(self, message: PipelineMessage):
+        """Queue translated request on the translation queue"""
         try:
-            self.channel.basic_publish(
-                exchange='',
-                routing_key=settings.TRANSLATION_QUEUE,
-                body=json.dumps(message)
-            )
-            logger.info("Translation request published to RabbitMQ.")
+            metrics.mark(message, 'translation_queued')
+            await transport.publish(settings.TRANSLATION_QUEUE, message)
+            logger.debug("Published %s to the translation queue", message)
         except Exception as e:
             logger.error(f"Error publishing translation request: {e}")
             raise
 
-    def produce(self):
+    def flush(self, model_key: str, batch: List[Tuple[str, asyncio.Future]]):
+        """Start translating a released batch; the consumer keeps receiving while several batches are in flight"""
+        task = asyncio.create_task(self.complete(model_key, batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def complete(self, model_key: str, batch: List[Tuple[str, asyncio.Future]]):
+        """Translate a batch and hand each result to the step waiting for it"""
+        source_lang, target_lang = model_key.split("-", 1)
+        texts = [text for text, _ in batch]
         try:
-            logger.info("Producing translation request.")
-            self.request['translation_text'] = self.translate(**self.request)
-            self.publish_translation()
+            start = time.time()
+            translations = await self.translate_batch(texts, source_lang, target_lang)
+            end = time.time()
+            for (_, done), translation in zip(batch, translations):
+                if not done.done():
+                    done.set_result((translation, start, end))
         except Exception as e:
-            logger.error(f"Error in produce method: {e}")
-
-    def consume(self):
-        logger.info("Starting to consume messages from RabbitMQ...")
-        def callback(ch, method, properties, body):
-            try:
-                if body is None:
-                    logger.error("Received an empty message (body is None).")
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                    return
-                
-                # Decode body from bytes and parse as JSON
-                message = json.loads(body.decode())
-                logger.info(f"Received message from RabbitMQ: {message}")
-                
-                # Save the message as a dict so we can use it with keyword arguments
-                self.request = message
-                
-                # Log the message keys to verify required data is present
-                logger.info(f"Message keys: {list(self.request.keys())}")
-                
-                # Process the message: perform the translation and publish the response
-                self.produce()
-            except Exception as e:
-                logger.error(f"Error processing received message: {e}")
-            finally:
-                ch.basic_ack(delivery_tag=method.delivery_tag)
+            logger.error(f"Error translating batch for {model_key}: {e}")
+            metrics.ERRORS.labels('translation').inc()
+            for _, done in batch:
+                if not done.done():
+                    done.set_exception(e)
+
+    def flush_due(self):
+        """Timer callback: flush batches whose wait window has elapsed, then re-arm the timer"""
+        self.flush_timer = None
+        for model_key, batch in self.batcher.pop_due():
+            self.flush(model_key, batch)
+        self.schedule_flush()
+
+    def schedule_flush(self):
+        deadline = self.batcher.next_deadline()
+        if deadline is not None and self.flush_timer is None:
+            self.flush_timer = asyncio.get_running_loop().call_later(deadline, self.flush_due)
+
+    def plan(self, source_lang: str, target_lang: str) -> List[str]:
+        """The languages a message goes through: direct model if one exists, else a pivot through PIVOT_LANGUAGE"""
+        path = translation_path(source_lang, target_lang)
+        metrics.TRANSLATION_PLANS.labels({1: "identity", 2: "direct"}.get(len(path), "pivot")).inc()
+        return path
+
+    async def translate_step(self, text: str, source_lang: str, target_lang: str) -> Tuple[str, float, float]:
+        """
+        Translate one text for one language pair through the micro-batcher.
+        Hits in the in-process cache tier are answered at once; only misses wait for a batch.
+        Identical steps already in flight on this node are shared rather than repeated, so a pivot
+        translation is computed once for every target language (and room member) that needs it.
+        """
+        if settings.TRANSLATION_CACHE_ENABLED:
+            model_id = self.get_model(source_lang, target_lang)
+            cached = translation_cache.get_local(translation_cache.make_key(text, source_lang, target_lang, model_id))
+            if cached is not None:
+                now = time.time()
+                return cached, now, now
+        step = (source_lang, target_lang, text)
+        shared = self.steps.get(step)
+        if shared is not None:
+            metrics.SHARED_STEPS.inc()
+        else:
+            shared = asyncio.get_running_loop().create_future()
+            self.steps[step] = shared
+            shared.add_done_callback(lambda _: self.steps.pop(step, None))
+            model_key = f"{source_lang}-{target_lang}"
+            batch = self.batcher.add(model_key, (text, shared))
+            if batch is not None:
+                self.flush(model_key, batch)
+            self.schedule_flush()
+        return await asyncio.shield(shared)
 
+    async def translate_path(self, text: str, plan: List[str]) -> Tuple[str, float, float]:
+        """Translate a text through every step of a plan; returns it and when its first step started and last ended"""
+        start = end = time.time()
+        for step, (source_lang, target_lang) in enumerate(zip(plan, plan[1:])):
+            text, step_start, end = await self.translate_step(text, source_lang, target_lang)
+            if step == 0:
+                start = step_start
+        return text, start, end
 
+    async def stream_segments(self, message: PipelineMessage) -> Tuple[str, float, float]:
+        """
+        Translate a long message's segments concurrently (they share micro-batches and are cached one by one),
+        publishing each as a partial result once it and every segment before it are done.
+        Returns the whole translation and when translation started and ended.
+        """
+        pieces = message.pieces()
+        tasks = [asyncio.ensure_future(self.translate_path(piece.strip(), message.plan)) for piece in pieces]
+        translations = []
+        start = end = None
         try:
-            logger.info("TranslationService is consuming messages...")
-            self.channel.basic_consume(queue=settings.DETECTION_QUEUE, 
-                                       on_message_callback=callback)
-            self.channel.start_consuming()
-        except Exception as e:
-            logger.error(f"Error in consume method: {e}")
+            for index, (piece, task) in enumerate(zip(pieces, tasks)):
+                translation, step_start, end = await task
+                start = step_start if start is None else min(start, step_start)
+                # Keep the source's spacing between segments, e.g. paragraph breaks
+                translations.append(translation + piece[len(piece.rstrip()):])
+                await self.publish_translation(message.for_segment(index, piece, translation))
         finally:
-            self.close()
+            for task in tasks:
+                task.cancel()
+        return "".join(translations), start, end
+
+    async def handle(self, message: PipelineMessage):
+        """Queue handler: translate the message along its plan and publish it; it is acked once published"""
+        logger.debug("Received message from the detection queue: %s", message)
+        metrics.mark(message, 'translation_dequeued')
+        metrics.observe(message, 'detection_queue')
+        try:
+            message.plan = self.plan(message.source_lang, message.target_lang)
+            if message.segments and len(message.plan) > 1:
+                text, start, end = await self.stream_segments(message)
+            else:
+                text, start, end = await self.translate_path(message.text, message.plan)
+            message.translation_text = text
+        except Exception as e:
+            logger.error(f"Error translating message {message.id}: {e}")
+            metrics.ERRORS.labels('translation').inc()
+            # Published as a failed result, so the sender and the room hear of it now rather than at their timeout
+            message.error = "translation_failed"
+            await self.publish_translation(message)
+            return
+        metrics.mark(message, 'translation_start', start)
+        metrics.mark(message, 'translation_end', end)
+        metrics.observe(message, 'translation')
+        await self.publish_translation(message)
+
+    async def consume(self):
+        """Consume the detection queue until cancelled"""
+        logger.info("TranslationService is consuming messages...")
+        await transport.consume(settings.DETECTION_QUEUE, self.handle)
 
     def close(self):
-        """Close RabbitMQ connection"""
+        """Release the worker pool and the translation backend, and drop batches left over from this event loop"""
         try:
-            self.connection.close()
-            logger.info("RabbitMQ connection closed.")
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            self.batcher = MicroBatcher(settings.TRANSLATION_BATCH_SIZE, settings.TRANSLATION_BATCH_WAIT_MS / 1000)
+            self.steps.clear()
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+            self.backend.close()
+            logger.info("TranslationService closed.")
         except Exception as e:
-            logger.error(f"Error closing RabbitMQ connection: {e}")
+            logger.error(f"Error closing TranslationService: {e}")
 
 # Create global instance
 translation_service = TranslationService()
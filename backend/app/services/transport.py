@@ -0,0 +1,480 @@
+import logging
+import time
+import asyncio
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
+import aio_pika
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+from core.config import settings
+from core.messages import PipelineMessage
+from services.ids import IdGenerator, SEQUENCE_BITS
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[PipelineMessage], Awaitable[None]]
+ResultHandler = Callable[[PipelineMessage], Awaitable[None]]
+
+class Transport(ABC):
+    """
+    How messages move between pipeline stages and how results reach the waiting WebSocket.
+    Queue handlers are coroutines run on the app's event loop; a message is acknowledged once its handler returns.
+    """
+    name = "base"
+
+    def __init__(self):
+        self.node_id = settings.NODE_ID
+
+    @abstractmethod
+    async def start(self):
+        """Connect; called once from the app's event loop before any other method"""
+
+    @abstractmethod
+    async def publish(self, queue: str, message: PipelineMessage):
+        """Send a message to a queue"""
+
+    @abstractmethod
+    async def consume(self, queue: str, handler: MessageHandler):
+        """Run `handler` for every message on a queue until cancelled"""
+
+    @abstractmethod
+    async def store_result(self, result: PipelineMessage):
+        """Append a finished result to its room's history and route it to the other nodes hosting the room"""
+
+    async def route_result(self, result: PipelineMessage):
+        """Route a result that is not stored, such as a streamed segment, to the other nodes hosting its room"""
+
+    @abstractmethod
+    async def room_history(self, room_id: str, language: str, since: str) -> List[PipelineMessage]:
+        """
+        Translations into `language` stored for a room after request `since`, oldest first;
+        at most the latest ROOM_HISTORY_BACKFILL of them. Raises ValueError for a malformed `since`.
+        """
+
+    @abstractmethod
+    async def subscribe_results(self, handler: ResultHandler):
+        """Run `handler(result)` for every result routed to this node by another node, until cancelled"""
+
+    async def set_room_languages(self, room_id: str, languages: Set[str]):
+        """Record the languages read by this node's members of a room; an empty set means none are left"""
+
+    async def room_languages(self, room_id: str) -> Set[str]:
+        """Languages read by a room's members on every node"""
+        return set()
+
+    async def keep_presence(self):
+        """Keep this node's rooms in the presence index alive until cancelled"""
+
+    @abstractmethod
+    async def queue_depth(self, queue: str) -> int:
+        """Number of messages waiting in a queue"""
+
+    async def is_ready(self) -> bool:
+        """Whether the transport can currently carry messages"""
+        return True
+
+    async def close(self):
+        """Disconnect"""
+
+class BrokerTransport(Transport):
+    """
+    RabbitMQ queues and Redis result storage, through asyncio-native clients running on the app's event loop.
+    Messages cross the broker in PipelineMessage's packed form, encoded once per hop.
+    Every consumer task gets its own channel with `CONSUMER_PREFETCH` prefetch; publishes share a
+    confirm-mode channel and their confirms are awaited in batches.
+    Results are appended to a capped Stream per room and language for backfill, under entry ids taken from
+    their message ids, so a reconnecting client's cursor maps straight to a stream range.
+    Results are routed between nodes through a Redis presence index, one hash per room mapping each node
+    with members in it to the languages they read: a result is published, payload included, only to the
+    channels of the nodes hosting its room. Each entry carries an expiry time, pushed back by the node's
+    heartbeat, so the entries of a node that died without cleaning up are ignored and then removed.
+    Each node keeps a local copy of the presence hashes it reads, so routing a result or translating a message
+    does not read Redis every time: a node changing its presence in a room announces it on PRESENCE_CHANNEL,
+    and every node drops that room's copy; the heartbeat drops them all, so a lost announcement or a node
+    that died is noticed within PRESENCE_HEARTBEAT_SECONDS.
+    """
+    name = "broker"
+
+    def __init__(self):
+        super().__init__()
+        # Rooms with members on this node -> the languages they read
+        self.rooms: Dict[str, Set[str]] = {}
+        # Local copy of presence hashes read: room -> node id -> (expires at, languages read there)
+        self.presence_cache: Dict[str, Dict[str, Tuple[float, Set[str]]]] = {}
+        # Bumped whenever copies are dropped, so a read started before then does not store a stale copy
+        self.presence_epoch = 0
+        self.connection = None
+        self.channel = None
+        self.redis_client = None
+        self.outbox: List = []
+        self.flush_scheduled = False
+
+    async def start(self):
+        await self.setup_rabbitmq()
+        self.setup_redis()
+
+    async def setup_rabbitmq(self):
+        """Setup the RabbitMQ connection and publishing channel, and declare the pipeline queues"""
+        try:
+            logger.info("Setting up RabbitMQ connection...")
+            self.connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
+            self.channel = await self.connection.channel(publisher_confirms=settings.PUBLISHER_CONFIRMS)
+            await self.channel.declare_queue(settings.DETECTION_QUEUE)
+            await self.channel.declare_queue(settings.TRANSLATION_QUEUE)
+            logger.info("RabbitMQ setup complete.")
+        except Exception as e:
+            logger.error(f"Failed to set up RabbitMQ: {e}")
+            raise
+
+    def setup_redis(self):
+        """Setup Redis connection."""
+        try:
+            logger.info("Setting up Redis connection")
+            self.redis_client = aioredis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB
+            )
+            logger.info("Redis setup completed")
+        except Exception as e:
+            logger.error(f"Failed to setup Redis: {e}")
+            raise
+
+    async def publish(self, queue: str, message: PipelineMessage):
+        """Publish and wait for the broker's confirm; publishes made in the same loop tick share one confirm wait"""
+        done = asyncio.get_running_loop().create_future()
+        self.outbox.append((queue, message.pack(), done))
+        if len(self.outbox) >= settings.PUBLISH_CONFIRM_BATCH:
+            await self.flush_outbox()
+        elif not self.flush_scheduled:
+            self.flush_scheduled = True
+            asyncio.get_running_loop().call_soon(lambda: asyncio.ensure_future(self.flush_outbox()))
+        await done
+
+    async def flush_outbox(self):
+        self.flush_scheduled = False
+        batch, self.outbox = self.outbox, []
+        if not batch:
+            return
+        confirms = await asyncio.gather(
+            *(self.channel.default_exchange.publish(aio_pika.Message(body), routing_key=queue)
+              for queue, body, _ in batch),
+            return_exceptions=True
+        )
+        for (queue, _, done), confirm in zip(batch, confirms):
+            if done.done():
+                continue
+            if isinstance(confirm, BaseException):
+                logger.error(f"Failed to publish message to RabbitMQ queue {queue}: {confirm}")
+                done.set_exception(confirm)
+            else:
+                done.set_result(None)
+
+    async def consume(self, queue: str, handler: MessageHandler):
+        channel = await self.connection.channel()
+        await channel.set_qos(prefetch_count=settings.CONSUMER_PREFETCH)
+        declared = await channel.declare_queue(queue)
+
+        async def on_message(incoming):
+            try:
+                message = PipelineMessage.unpack(incoming.body)
+            except Exception as e:
+                logger.error(f"Error decoding message from {queue}: {e}")
+                await incoming.ack()
+                return
+            try:
+                await handler(message)
+            except Exception as e:
+                logger.error(f"Error handling message from {queue}: {e}")
+            finally:
+                await incoming.ack()
+
+        consumer_tag = await declared.consume(on_message)
+        logger.info(f"Consuming messages from {queue}...")
+        try:
+            await asyncio.Future()
+        finally:
+            try:
+                await declared.cancel(consumer_tag)
+                await channel.close()
+            except Exception as e:
+                logger.warning(f"Error closing consumer channel for {queue}: {e}")
+
+    def presence_key(self, room_id: str) -> str:
+        return f"{settings.ROOM_PRESENCE_PREFIX}:{room_id}"
+
+    def node_channel(self, node_id: str) -> str:
+        return f"{settings.RESULT_CHANNEL}:{node_id}"
+
+    def history_key(self, room_id: str, language: str) -> str:
+        return f"{settings.ROOM_HISTORY_PREFIX}:{room_id}:{language}"
+
+    @staticmethod
+    def presence_entry(languages: Set[str]) -> str:
+        """A presence hash value: when it expires (unix seconds), then the languages read"""
+        return f"{time.time() + settings.PRESENCE_TTL:.0f}|{','.join(sorted(languages))}"
+
+    def set_presence(self, pipe, room_id: str, languages: Set[str]):
+        key = self.presence_key(room_id)
+        pipe.hset(key, self.node_id, self.presence_entry(languages))
+        # The whole hash goes once every node hosting the room has stopped heartbeating
+        pipe.expire(key, int(settings.PRESENCE_TTL))
+
+    async def set_room_languages(self, room_id: str, languages: Set[str]):
+        pipe = self.redis_client.pipeline(transaction=False)
+        if languages:
+            self.rooms[room_id] = set(languages)
+            self.set_presence(pipe, room_id, languages)
+        else:
+            self.rooms.pop(room_id, None)
+            pipe.hdel(self.presence_key(room_id), self.node_id)
+        pipe.publish(settings.PRESENCE_CHANNEL, room_id)
+        await pipe.execute()
+        self.forget_presence(room_id)
+
+    def forget_presence(self, room_id: str = None):
+        """Drop the local copy of a room's presence, or of every room's"""
+        self.presence_epoch += 1
+        if room_id is None:
+            self.presence_cache.clear()
+        else:
+            self.presence_cache.pop(room_id, None)
+
+    async def keep_presence(self):
+        while True:
+            await asyncio.sleep(settings.PRESENCE_HEARTBEAT_SECONDS)
+            self.forget_presence()
+            if not self.rooms:
+                continue
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for room_id, languages in list(self.rooms.items()):
+                    self.set_presence(pipe, room_id, languages)
+                await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Presence heartbeat failed: {e}")
+
+    async def presence(self, room_id: str) -> Dict[str, Set[str]]:
+        """Live entries of a room's presence hash: node id -> languages read there"""
+        entries = self.presence_cache.get(room_id)
+        if entries is None:
+            entries = await self.read_presence(room_id)
+        now = time.time()
+        return {node_id: languages for node_id, (expires_at, languages) in entries.items() if expires_at >= now}
+
+    async def read_presence(self, room_id: str) -> Dict[str, Tuple[float, Set[str]]]:
+        """Read a room's presence hash into the local copy; expired entries are removed from it"""
+        epoch = self.presence_epoch
+        key = self.presence_key(room_id)
+        now = time.time()
+        entries, expired = {}, []
+        for node_id, value in (await self.redis_client.hgetall(key)).items():
+            expires_at, _, languages = value.decode().partition("|")
+            if float(expires_at) < now:
+                expired.append(node_id)
+            else:
+                entries[node_id.decode()] = (float(expires_at), set(languages.split(",")))
+        if expired:
+            await self.redis_client.hdel(key, *expired)
+        if epoch == self.presence_epoch:
+            self.presence_cache[room_id] = entries
+        return entries
+
+    async def room_languages(self, room_id: str) -> Set[str]:
+        return {language for languages in (await self.presence(room_id)).values() for language in languages}
+
+    async def other_nodes(self, room_id: str) -> List[str]:
+        """The other nodes hosting a room"""
+        return [node_id for node_id in await self.presence(room_id) if node_id != self.node_id]
+
+    @staticmethod
+    def stream_id(request_id: str, after: bool = False) -> str:
+        """
+        Stream entry id for a message: its snowflake timestamp, then its worker id and sequence.
+        With `after`, the first id following it, to range over the entries after a cursor.
+        """
+        parts = IdGenerator.parse(str(request_id).split("-", 1)[0])
+        sequence = (parts["worker_id"] << SEQUENCE_BITS) | parts["sequence"]
+        return f"{parts['timestamp_ms']}-{sequence + 1 if after else sequence}"
+
+    async def store_result(self, result: PipelineMessage):
+        payload = result.pack()
+        nodes = await self.other_nodes(result.room_id)
+        # One round trip for the history entry and the notifications
+        pipe = self.redis_client.pipeline(transaction=False)
+        key = self.history_key(result.room_id, result.target_lang)
+        if settings.ROOM_HISTORY_MAXLEN:
+            pipe.xadd(key, {"m": payload}, id=self.stream_id(result.id),
+                      maxlen=settings.ROOM_HISTORY_MAXLEN, approximate=True)
+            pipe.expire(key, settings.ROOM_HISTORY_TTL)
+        for node_id in nodes:
+            pipe.publish(self.node_channel(node_id), payload)
+        replies = await pipe.execute(raise_on_error=False)
+        if settings.ROOM_HISTORY_MAXLEN and isinstance(replies[0], ResponseError):
+            # A newer message of the room was stored first; this one is appended after it instead,
+            # so a client whose cursor lies in between may be sent it again, but never misses it
+            replies[0] = None
+            await self.redis_client.xadd(key, {"m": payload}, maxlen=settings.ROOM_HISTORY_MAXLEN, approximate=True)
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise reply
+
+    async def route_result(self, result: PipelineMessage):
+        nodes = await self.other_nodes(result.room_id)
+        if not nodes:
+            return
+        payload = result.pack()
+        pipe = self.redis_client.pipeline(transaction=False)
+        for node_id in nodes:
+            pipe.publish(self.node_channel(node_id), payload)
+        await pipe.execute()
+
+    async def room_history(self, room_id: str, language: str, since: str) -> List[PipelineMessage]:
+        entries = await self.redis_client.xrevrange(
+            self.history_key(room_id, language), min=self.stream_id(since, after=True),
+            count=settings.ROOM_HISTORY_BACKFILL
+        )
+        messages = [PipelineMessage.unpack(fields[b"m"]) for _, fields in reversed(entries)]
+        # Only an entry appended out of order can be the cursor's own message
+        return [message for message in messages if message.id != since]
+
+    async def subscribe_results(self, handler: ResultHandler):
+        pubsub = self.redis_client.pubsub()
+        channel = self.node_channel(self.node_id)
+        await pubsub.subscribe(channel, settings.PRESENCE_CHANNEL)
+        logger.info(f"Subscribed to '{channel}' and '{settings.PRESENCE_CHANNEL}'")
+        tasks = set()
+        try:
+            async for message in pubsub.listen():
+                if message['type'] != 'message':
+                    continue
+                if message['channel'].decode() == settings.PRESENCE_CHANNEL:
+                    self.forget_presence(message['data'].decode())
+                    continue
+                # Hand off so one slow room does not hold up results for the others
+                task = asyncio.create_task(handler(PipelineMessage.unpack(message['data'])))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            await pubsub.aclose()
+
+    async def queue_depth(self, queue: str) -> int:
+        declared = await self.channel.declare_queue(queue, passive=True)
+        return declared.declaration_result.message_count
+
+    async def is_ready(self) -> bool:
+        if self.connection is None or self.connection.is_closed or self.redis_client is None:
+            return False
+        try:
+            return bool(await asyncio.wait_for(self.redis_client.ping(), timeout=1.0))
+        except Exception as e:
+            logger.warning(f"Redis ping failed: {e}")
+            return False
+
+    async def close(self):
+        try:
+            if self.connection is not None:
+                await self.connection.close()
+            if self.redis_client is not None:
+                if self.rooms:
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    for room_id in self.rooms:
+                        pipe.hdel(self.presence_key(room_id), self.node_id)
+                        pipe.publish(settings.PRESENCE_CHANNEL, room_id)
+                    await pipe.execute()
+                self.forget_presence()
+                await self.redis_client.aclose()
+            logger.info("RabbitMQ and Redis connections closed.")
+        except Exception as e:
+            logger.error(f"Error closing broker connections: {e}")
+
+class InProcessTransport(Transport):
+    """
+    asyncio queues inside one process: no RabbitMQ, no Redis, no network hops.
+    For single-node/edge deployments and dependency-free tests; every room is hosted by this one node.
+    """
+    name = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.history: Dict[Tuple[str, str], deque] = {}
+
+    def get_queue(self, queue: str) -> asyncio.Queue:
+        if queue not in self.queues:
+            self.queues[queue] = asyncio.Queue()
+        return self.queues[queue]
+
+    async def start(self):
+        logger.info("Using in-process transport.")
+
+    async def publish(self, queue: str, message: PipelineMessage):
+        # Handed over as is: nothing is serialized in process
+        self.get_queue(queue).put_nowait(message)
+
+    async def consume(self, queue: str, handler: MessageHandler):
+        pending = self.get_queue(queue)
+        # Like RabbitMQ prefetch: at most CONSUMER_PREFETCH unfinished handlers per consumer
+        prefetch = asyncio.Semaphore(settings.CONSUMER_PREFETCH)
+        tasks = set()
+        logger.info(f"Consuming messages from {queue}...")
+        try:
+            while True:
+                await prefetch.acquire()
+                message = await pending.get()
+                task = asyncio.create_task(self.handle(queue, handler, message, prefetch))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in list(tasks):
+                task.cancel()
+
+    async def handle(self, queue: str, handler: MessageHandler, message: PipelineMessage, prefetch: asyncio.Semaphore):
+        try:
+            await handler(message)
+        except Exception as e:
+            logger.error(f"Error handling message from {queue}: {e}")
+        finally:
+            prefetch.release()
+
+    async def store_result(self, result: PipelineMessage):
+        if settings.ROOM_HISTORY_MAXLEN:
+            key = (result.room_id, result.target_lang)
+            if key not in self.history:
+                self.history[key] = deque(maxlen=settings.ROOM_HISTORY_MAXLEN)
+            self.history[key].append(result)
+
+    async def room_history(self, room_id: str, language: str, since: str) -> List[PipelineMessage]:
+        # Ids order by creation time across nodes
+        since_id = int(since.split("-", 1)[0])
+        entries = [
+            entry for entry in self.history.get((room_id, language), ()) if int(entry.id.split("-", 1)[0]) > since_id
+        ]
+        return entries[-settings.ROOM_HISTORY_BACKFILL:]
+
+    async def subscribe_results(self, handler: ResultHandler):
+        # There are no other nodes to receive results from.
+        await asyncio.Event().wait()
+
+    async def queue_depth(self, queue: str) -> int:
+        return self.get_queue(queue).qsize()
+
+    async def close(self):
+        # Queues belong to the event loop they were used on; a restart gets new ones
+        self.queues.clear()
+
+TRANSPORTS = {
+    BrokerTransport.name: BrokerTransport,
+    InProcessTransport.name: InProcessTransport,
+}
+
+def create_transport(name: str = None) -> Transport:
+    """Build the transport named in settings.TRANSPORT"""
+    name = name or settings.TRANSPORT
+    if name not in TRANSPORTS:
+        raise ValueError(f"Unknown transport '{name}', expected one of {sorted(TRANSPORTS)}")
+    return TRANSPORTS[name]()
+
+# Create global instance
+transport = create_transport()
@@ -0,0 +1,295 @@
+"""
+End-to-end load generator for the chat pipeline.
+
+Starts the FastAPI app with in-process RabbitMQ/Redis fakes (or the in-process
+transport) and a stub translation backend, drives many concurrent /ws/chat/{room_id} clients at a fixed message rate,
+and reports throughput, end-to-end latency percentiles and a per-stage breakdown.
+Results are written as JSON; pass --compare to check a run against an earlier one.
+With --connect it drives already running nodes instead (see run_nodes.py), spreading
+each room's clients across them to exercise cross-node delivery.
+
+Usage (from the backend directory):
+    python benchmarks/bench_e2e.py --clients 50 --rate 2 --duration 20 --output run.json
+    python benchmarks/bench_e2e.py --compare baseline.json --output run.json
+    python benchmarks/bench_e2e.py --connect ws://127.0.0.1:8001,ws://127.0.0.1:8002
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import threading
+import time
+
+import msgpack
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "app"))
+
+import fakes  # noqa: E402
+from core.metrics import STAGES  # noqa: E402
+
+WORDS = {
+    "en": "the quick brown fox jumps over a lazy dog while we wait for the meeting to start".split(),
+    "es": "el rápido zorro marrón salta sobre un perro perezoso mientras esperamos la reunión".split(),
+    "fr": "le renard brun rapide saute par dessus un chien paresseux pendant que nous attendons".split(),
+}
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": pick(0.50) * 1000,
+        "p95_ms": pick(0.95) * 1000,
+        "p99_ms": pick(0.99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+def make_text(rng: random.Random, mean_words: float, seq: str):
+    """
+    Text of lognormally distributed length in a random supported language, in sentences of ten words,
+    tagged with a unique sequence
+    """
+    lang = rng.choice(list(WORDS))
+    count = max(1, int(rng.lognormvariate(0, 0.75) * mean_words))
+    words = [rng.choice(WORDS[lang]) + ("." if i % 10 == 9 else "") for i in range(count)]
+    return lang, " ".join(words) + f" {seq}"
+
+class Recorder:
+    def __init__(self):
+        self.sent = 0
+        self.pending = {}
+        self.owners = {}
+        self.latencies = []
+        self.first_segments = []
+        self.segments = 0
+        self.stages = {}
+        self.timeouts = 0
+        self.errors = 0
+        self.misrouted = 0
+        self.broadcasts = 0
+        self.busy = 0
+
+    def on_response(self, raw, received_at: float, index: int):
+        try:
+            # Binary frames are msgpack
+            response = msgpack.unpackb(raw) if isinstance(raw, bytes) else json.loads(raw)
+        except ValueError:
+            response = raw
+        if response == "Processing timed out":
+            self.timeouts += 1
+            return
+        if not isinstance(response, dict):
+            self.errors += 1
+            return
+        if response.get("type") == "ack":
+            return
+        if response.get("type") == "busy":
+            # Refused by admission control; nothing more will arrive for it
+            self.busy += 1
+            self.pending.pop(response.get("client_msg_id"), None)
+            return
+        client_msg_id = (response.get("correlation") or {}).get("client_msg_id")
+        owner = self.owners.get(client_msg_id)
+        if response.get("type") == "segment":
+            # A streamed segment of a long message; its "complete" frame is counted below
+            self.segments += 1
+            if owner == index and response.get("segment") == 0 and client_msg_id in self.pending:
+                self.first_segments.append(received_at - self.pending[client_msg_id])
+            return
+        if owner is not None and owner != index:
+            # Another room member's message, fanned out to this client
+            self.broadcasts += 1
+            return
+        sent_at = self.pending.pop(client_msg_id, None)
+        if sent_at is None:
+            # A response for a message this client never sent, or a duplicate
+            self.misrouted += 1
+            return
+        self.latencies.append(received_at - sent_at)
+        ts = response.get("ts") or {}
+        for stage, (start, end) in STAGES.items():
+            if start in ts and end in ts:
+                self.stages.setdefault(stage, []).append(max(0.0, ts[end] - ts[start]))
+
+async def client(url: str, index: int, args, recorder: Recorder, stop_at: float):
+    import websockets
+    rng = random.Random(args.seed + index)
+    interval = 1.0 / args.rate
+    subprotocols = [args.format] if args.format == "msgpack" else None
+    encode = msgpack.packb if args.format == "msgpack" else json.dumps
+    async with websockets.connect(url, max_queue=None, subprotocols=subprotocols) as ws:
+        async def reader():
+            async for raw in ws:
+                recorder.on_response(raw, time.perf_counter(), index)
+
+        reader_task = asyncio.create_task(reader())
+        seq = 0
+        batch = []
+        # Stagger clients so they do not all fire on the same tick
+        await asyncio.sleep(rng.random() * interval)
+        while time.perf_counter() < stop_at:
+            client_msg_id = f"{index}.{seq}"
+            lang, text = make_text(rng, args.mean_words, f"#{client_msg_id}")
+            seq += 1
+            recorder.owners[client_msg_id] = index
+            recorder.pending[client_msg_id] = time.perf_counter()
+            recorder.sent += 1
+            frame = {"text": text, "target_lang": args.target_lang, "client_msg_id": client_msg_id}
+            if args.source_lang:
+                frame["source_lang"] = lang
+            batch.append(frame)
+            if len(batch) >= args.batch:
+                # A batch frame is a list of messages
+                await ws.send(encode(batch if args.batch > 1 else batch[0]))
+                batch = []
+            await asyncio.sleep(rng.expovariate(args.rate) if args.poisson else interval)
+        if batch:
+            await ws.send(encode(batch))
+        # Drain outstanding responses
+        deadline = time.perf_counter() + args.drain
+        while any(recorder.owners[client_msg_id] == index for client_msg_id in list(recorder.pending)) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        reader_task.cancel()
+
+async def drive(args, recorder: Recorder):
+    stop_at = time.perf_counter() + args.duration
+    nodes = args.connect.split(",") if args.connect else [f"ws://127.0.0.1:{args.port}"]
+    # Consecutive clients share a room but not a node
+    tasks = [
+        client(f"{nodes[i % len(nodes)]}/ws/chat/room-{i // len(nodes) % args.rooms}?lang={args.target_lang}",
+               i, args, recorder, stop_at)
+        for i in range(args.clients)
+    ]
+    started = time.perf_counter()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return time.perf_counter() - started
+
+def start_app(args):
+    """Configure settings for the fakes, import the app and start its consumers and HTTP server"""
+    from core.config import settings
+    stub_server = None
+    if args.backend == "remote-stub":
+        stub_server, settings.HUGGINGFACE_MODEL_URL = fakes.start_inference_stub(args.inference_latency_ms)
+        settings.TRANSLATION_BACKEND = "remote"
+    else:
+        settings.TRANSLATION_BACKEND = "stub"
+        settings.STUB_BACKEND_LATENCY_MS = args.inference_latency_ms
+        settings.STUB_BACKEND_MS_PER_CHAR = args.inference_ms_per_char
+    if args.no_stream:
+        settings.STREAM_MIN_CHARS = sys.maxsize
+    settings.TRANSLATION_CACHE_ENABLED = not args.no_cache
+    settings.TRANSPORT = args.transport
+    settings.LOG_LEVEL = "WARNING"
+    settings.TRACE_SAMPLE_RATE = args.trace_sample_rate
+
+    import uvicorn
+    import main
+    # Load the langid model up front so the first messages do not measure it
+    from services.language_classifier import language_classifier
+    language_classifier.get_identifier()
+
+    # The app's lifespan starts the pipeline consumers
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=args.port, log_level="warning"))
+    threading.Thread(target=server.run, name="uvicorn", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, stub_server
+
+def compare(result, baseline_path: str, tolerance: float) -> bool:
+    """Print deltas against a previous run; returns False if p99 or throughput regressed beyond `tolerance`"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    ok = True
+    checks = [
+        ("throughput_msgs_per_s", result["throughput_msgs_per_s"], baseline["throughput_msgs_per_s"], True),
+        ("end_to_end.p99_ms", result["end_to_end"].get("p99_ms", 0), baseline["end_to_end"].get("p99_ms", 0), False),
+        ("end_to_end.p50_ms", result["end_to_end"].get("p50_ms", 0), baseline["end_to_end"].get("p50_ms", 0), False),
+    ]
+    for name, current, previous, higher_is_better in checks:
+        change = (current - previous) / previous if previous else 0.0
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        ok = ok and not regressed
+        print(f"{name:<24} {previous:>10.2f} -> {current:>10.2f} ({change:+.1%}){'  REGRESSION' if regressed else ''}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--rooms", type=int, default=5)
+    parser.add_argument("--rate", type=float, default=2.0, help="messages per second per client")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times instead of fixed")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--drain", type=float, default=5.0, help="seconds to wait for outstanding responses")
+    parser.add_argument("--mean-words", type=float, default=8.0, help="mean message length in words")
+    parser.add_argument("--target-lang", default="en")
+    parser.add_argument("--source-lang", action="store_true", help="name each message's language, skipping detection")
+    parser.add_argument("--format", choices=["json", "msgpack"], default="json", help="client wire format")
+    parser.add_argument("--batch", type=int, default=1, help="messages per client frame")
+    parser.add_argument("--backend", choices=["stub", "remote-stub"], default="stub",
+                        help="'stub' translates in-process, 'remote-stub' goes through the HTTP client to a local stub server")
+    parser.add_argument("--inference-latency-ms", type=float, default=5.0)
+    parser.add_argument("--inference-ms-per-char", type=float, default=0.0,
+                        help="extra stub latency per character of a batch's longest text")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--no-stream", action="store_true", help="translate long messages whole instead of streaming segments")
+    parser.add_argument("--transport", choices=["broker", "memory"], default="broker",
+                        help="'broker' uses the RabbitMQ/Redis fakes, 'memory' the in-process transport")
+    parser.add_argument("--trace-sample-rate", type=float, default=0.0,
+                        help="fraction of messages the app logs per-stage timings for")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--connect", help="comma-separated ws:// base URLs of running nodes; skips the in-process app")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="previous JSON result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression for --compare")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    server = stub_server = None
+    if not args.connect:
+        fakes.install()
+        server, stub_server = start_app(args)
+
+    recorder = Recorder()
+    elapsed = asyncio.run(drive(args, recorder))
+    if server is not None:
+        server.should_exit = True
+    if stub_server is not None:
+        stub_server.shutdown()
+
+    result = {
+        "config": vars(args),
+        "platform": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "sent": recorder.sent,
+        "received": len(recorder.latencies),
+        "timeouts": recorder.timeouts,
+        "errors": recorder.errors,
+        "misrouted": recorder.misrouted,
+        "broadcasts": recorder.broadcasts,
+        "busy": recorder.busy,
+        "segments": recorder.segments,
+        "lost": len(recorder.pending),
+        "elapsed_s": elapsed,
+        "throughput_msgs_per_s": len(recorder.latencies) / elapsed if elapsed else 0.0,
+        "end_to_end": percentiles(recorder.latencies),
+        "first_segment": percentiles(recorder.first_segments),
+        "stages": {stage: percentiles(values) for stage, values in recorder.stages.items()},
+    }
+    print(json.dumps({key: result[key] for key in result if key != "config"}, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare and not compare(result, args.compare, args.tolerance):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Micro-benchmark for language detection throughput.
+
+Compares building the langid identifier per message (the old behaviour),
+classifying per message with the shared identifier, and batched classification.
+
+Usage (from the backend directory):
+    python benchmarks/bench_language_detection.py --messages 2000 --batch-size 64
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from langid.langid import LanguageIdentifier, model  # noqa: E402
+from services.language_classifier import LanguageClassifier  # noqa: E402
+
+SAMPLES = [
+    "ok",
+    "thanks!",
+    "Hello, how are you doing today?",
+    "The meeting has been moved to three o'clock tomorrow afternoon.",
+    "Hola, ¿cómo estás?",
+    "Gracias por tu ayuda, nos vemos mañana en la oficina.",
+    "Bonjour, comment ça va ?",
+    "Je ne peux pas venir ce soir, désolé. On se voit demain ?",
+]
+
+
+def report(name: str, count: int, elapsed: float):
+    print(f"{name:<28} {count / elapsed:>12.1f} msg/s {elapsed * 1e6 / count:>10.1f} us/msg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--rebuild-messages", type=int, default=3,
+                        help="messages to run through the rebuild-per-message path (it is very slow)")
+    args = parser.parse_args()
+
+    random.seed(0)
+    texts = [random.choice(SAMPLES) for _ in range(args.messages)]
+    classifier = LanguageClassifier()
+
+    start = time.perf_counter()
+    classifier.get_identifier()
+    print(f"identifier build: {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+    start = time.perf_counter()
+    for text in texts[:args.rebuild_messages]:
+        LanguageIdentifier.from_modelstring(model, norm_probs=True).classify(text.lower())
+    report("rebuild per message", args.rebuild_messages, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    single = [classifier.classify(text) for text in texts]
+    report("shared, per message", len(texts), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    batched = []
+    for offset in range(0, len(texts), args.batch_size):
+        batched.extend(classifier.classify_batch(texts[offset:offset + args.batch_size]))
+    report(f"shared, batch={args.batch_size}", len(texts), time.perf_counter() - start)
+
+    mismatches = sum(1 for a, b in zip(single, batched) if a[0] != b[0])
+    print(f"label mismatches between per-message and batched: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
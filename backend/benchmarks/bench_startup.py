@@ -0,0 +1,102 @@
+"""
+Cold-start benchmark: how soon a fresh node can take traffic.
+
+For each run it starts a new interpreter serving the app with the in-process RabbitMQ/Redis fakes
+and stub translation backend, and measures from spawn to:
+  - import:  `import main` finished (reported by the child)
+  - healthz: GET /healthz answers 200 (liveness; the node can accept connections)
+  - readyz:  GET /readyz answers 200 (transport connected, models warm)
+
+Usage (from the backend directory):
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --preload-models --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def serve(args):
+    """Child process: run the app with the fakes on args.port"""
+    started = time.perf_counter()
+    sys.path.insert(0, HERE)
+    sys.path.insert(0, os.path.join(HERE, "..", "app"))
+    import fakes
+    fakes.install()
+    from core.config import settings
+    settings.TRANSLATION_BACKEND = "stub"
+    settings.TRANSPORT = args.transport
+    settings.PRELOAD_MODELS = args.preload_models
+    settings.LOG_LEVEL = "WARNING"
+    import main
+    import uvicorn
+    print(json.dumps({"import_s": time.perf_counter() - started}), flush=True)
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+def wait_for(url: str, deadline: float) -> float:
+    """Poll `url` until it answers 200, returning the time it did"""
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{url} not ready before the deadline")
+
+def run_once(args):
+    command = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(args.port),
+               "--transport", args.transport]
+    if args.preload_models:
+        command.append("--preload-models")
+    spawned = time.perf_counter()
+    child = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        deadline = spawned + args.timeout
+        base = f"http://127.0.0.1:{args.port}"
+        healthy = wait_for(f"{base}/healthz", deadline)
+        ready = wait_for(f"{base}/readyz", deadline)
+        child_report = json.loads(child.stdout.readline())
+        return {
+            "import_s": child_report["import_s"],
+            "healthz_s": healthy - spawned,
+            "readyz_s": ready - spawned,
+        }
+    finally:
+        child.terminate()
+        child.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--transport", choices=["broker", "memory"], default="broker")
+    parser.add_argument("--preload-models", action="store_true", help="include backend warm-up in readiness")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for each run")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args)
+
+    runs = [run_once(args) for _ in range(args.runs)]
+    result = {
+        "config": vars(args),
+        "runs": runs,
+        "median": {key: statistics.median(run[key] for run in runs) for key in runs[0]},
+    }
+    print(json.dumps(result["median"], indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
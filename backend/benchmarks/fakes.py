@@ -0,0 +1,159 @@
+"""
+In-process stand-ins for RabbitMQ, Redis and the HuggingFace inference endpoint.
+
+They implement just the parts of aio-pika, redis-py and the inference
+HTTP API that the services use, so the whole pipeline runs on one box with no brokers.
+`install()` must be called before any `services.*` module is imported.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+CONSUMER_TAGS = itertools.count(1)
+
+class FakeBroker:
+    """Named asyncio queues shared by every FakeConnection"""
+    def __init__(self):
+        self.queues = {}
+
+    def get_queue(self, name):
+        if name not in self.queues:
+            self.queues[name] = asyncio.Queue()
+        return self.queues[name]
+
+class FakeIncomingMessage:
+    def __init__(self, body, release):
+        self.body = body
+        self.release = release
+
+    async def ack(self):
+        self.release()
+
+class FakeQueue:
+    def __init__(self, channel, name):
+        self.channel = channel
+        self.broker = channel.broker
+        self.name = name
+        self.consumers = {}
+
+    @property
+    def declaration_result(self):
+        return SimpleNamespace(message_count=self.broker.get_queue(self.name).qsize())
+
+    async def consume(self, callback, **kwargs):
+        tag = f"ctag-{next(CONSUMER_TAGS)}"
+        self.consumers[tag] = asyncio.ensure_future(self.deliver(callback, self.channel.prefetch_count))
+        return tag
+
+    async def deliver(self, callback, prefetch_count):
+        pending = self.broker.get_queue(self.name)
+        # Unacked deliveries are bounded by the channel's prefetch, as in RabbitMQ
+        window = asyncio.Semaphore(prefetch_count or 1 << 30)
+        while True:
+            await window.acquire()
+            body = await pending.get()
+            asyncio.ensure_future(callback(FakeIncomingMessage(body, window.release)))
+
+    async def cancel(self, tag):
+        self.consumers.pop(tag).cancel()
+
+class FakeExchange:
+    def __init__(self, broker):
+        self.broker = broker
+
+    async def publish(self, message, routing_key, **kwargs):
+        self.broker.get_queue(routing_key).put_nowait(message.body)
+
+class FakeChannel:
+    def __init__(self, broker):
+        self.broker = broker
+        self.default_exchange = FakeExchange(broker)
+        self.prefetch_count = 0
+
+    async def set_qos(self, prefetch_count=0, **kwargs):
+        self.prefetch_count = prefetch_count
+
+    async def declare_queue(self, name, passive=False, **kwargs):
+        self.broker.get_queue(name)
+        return FakeQueue(self, name)
+
+    async def close(self):
+        pass
+
+class FakeConnection:
+    """Mimics aio_pika's RobustConnection on top of a FakeBroker"""
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_closed = False
+
+    async def channel(self, publisher_confirms=True, **kwargs):
+        return FakeChannel(self.broker)
+
+    async def close(self):
+        self.is_closed = True
+
+class StubInferenceHandler(BaseHTTPRequestHandler):
+    """
+    Answers HF-style translation requests: {"inputs": ...} -> [{"translation_text": ...}].
+    Responses listed in `script` are served first, one per request, as (status, headers, JSON body or raw bytes);
+    `requests` counts the requests received.
+    """
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    script = None
+    requests = None
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append(self.path)
+        inputs = body["inputs"] if isinstance(body["inputs"], list) else [body["inputs"]]
+        target = self.path.rsplit("-", 1)[-1]
+        if self.latency:
+            time.sleep(self.latency)
+        status, headers, answer = 200, {}, [{"translation_text": f"[{target}] {text}"} for text in inputs]
+        if self.script:
+            status, headers, answer = self.script.pop(0)
+        payload = answer if isinstance(answer, bytes) else json.dumps(answer).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+def start_inference_stub(latency_ms: float = 0.0, script=None):
+    """
+    Start a local stub inference server, returning (server, model URL template).
+    `script` lists scripted responses to serve first (see StubInferenceHandler); `server.requests` records requests.
+    """
+    handler = type("Handler", (StubInferenceHandler,), {
+        "latency": latency_ms / 1000, "script": list(script or []), "requests": [],
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.requests = handler.requests
+    threading.Thread(target=server.serve_forever, name="inference-stub", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/models/opus-mt-{{src}}-{{tgt}}"
+
+def install():
+    """Patch aio-pika and redis so the services connect to the in-process fakes"""
+    import aio_pika
+    import fakeredis
+    import redis.asyncio
+
+    broker = FakeBroker()
+    redis_server = fakeredis.FakeServer()
+
+    async def connect_robust(*args, **kwargs):
+        return FakeConnection(broker)
+
+    aio_pika.connect_robust = connect_robust
+    redis.asyncio.Redis = lambda *args, **kwargs: fakeredis.FakeAsyncRedis(server=redis_server)
+    return broker, redis_server
@@ -0,0 +1,52 @@
+"""
+Multi-node testbed: runs several uvicorn processes of the app on one machine,
+sharing a real RabbitMQ and Redis, so rooms span nodes the way they do behind Nginx.
+
+Usage (from the backend directory, with RabbitMQ and Redis running):
+    python benchmarks/run_nodes.py --nodes 3 --base-port 8001
+    python benchmarks/bench_e2e.py --connect ws://127.0.0.1:8001,ws://127.0.0.1:8002,ws://127.0.0.1:8003
+Ctrl-C stops every node.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, "..", "app")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--base-port", type=int, default=8001)
+    parser.add_argument("--backend", default="stub", help="TRANSLATION_BACKEND for every node")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    processes = []
+    for index in range(args.nodes):
+        port = args.base_port + index
+        env = dict(os.environ, NODE_ID=f"node-{index}", TRANSLATION_BACKEND=args.backend, TRANSPORT="broker",
+                   LOG_LEVEL=args.log_level.upper())
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", args.log_level],
+            cwd=APP_DIR, env=env,
+        ))
+        print(f"node-{index}: ws://127.0.0.1:{port}")
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+        for process in processes:
+            process.wait()
+
+if __name__ == "__main__":
+    main()
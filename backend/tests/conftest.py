@@ -0,0 +1,11 @@
+import os
+import sys
+
+# No RabbitMQ, Redis or inference API in tests; read by the settings when the app modules are imported
+os.environ.setdefault("TRANSPORT", "memory")
+os.environ.setdefault("TRANSLATION_BACKEND", "stub")
+
+# The app imports its modules relative to backend/app, as when run with `uvicorn main:app` from there
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "app"))
+sys.path.insert(0, os.path.join(HERE, "..", "benchmarks"))
@@ -0,0 +1,34 @@
+import pytest
+from core.config import settings
+from services.admission import AdmissionController, TokenBucket
+
+def test_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(rate=2.0, burst=3)
+    now = bucket.updated
+    assert [bucket.take(now) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take(now) == pytest.approx(0.5)
+    assert bucket.take(now + 0.5) == 0.0
+
+def test_bucket_refills_up_to_its_burst():
+    bucket = TokenBucket(rate=10.0, burst=2)
+    now = bucket.updated + 60
+    assert [bucket.take(now) for _ in range(2)] == [0.0, 0.0]
+    assert bucket.take(now) > 0.0
+
+def test_flooding_connection_leaves_the_room_bucket_alone(monkeypatch):
+    monkeypatch.setattr(settings, "CONNECTION_RATE", 5.0)
+    monkeypatch.setattr(settings, "CONNECTION_BURST", 10)
+    monkeypatch.setattr(settings, "ROOM_RATE", 50.0)
+    monkeypatch.setattr(settings, "ROOM_BURST", 100)
+    controller = AdmissionController()
+    admitted = sum(controller.check("flooder", "lobby", in_flight=0) is None for _ in range(500))
+    assert admitted == 10
+    assert controller.check("neighbour", "lobby", in_flight=0) is None
+
+def test_room_bucket_is_shared_by_its_connections(monkeypatch):
+    monkeypatch.setattr(settings, "ROOM_RATE", 1.0)
+    monkeypatch.setattr(settings, "ROOM_BURST", 2)
+    controller = AdmissionController()
+    assert controller.check("a", "lobby", in_flight=0) is None
+    assert controller.check("b", "lobby", in_flight=0) is None
+    assert controller.check("c", "lobby", in_flight=0).reason == "room_rate"
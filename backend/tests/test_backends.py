@@ -0,0 +1,13 @@
+import pytest
+from services.backends import create_backend, translation_path
+
+def test_translation_paths():
+    assert translation_path("en", "en") == ["en"]
+    assert translation_path("en", "es") == ["en", "es"]
+    assert translation_path("es", "fr") == ["es", "en", "fr"]
+    with pytest.raises(ValueError):
+        translation_path("en", "xx")
+
+def test_unknown_backend_is_refused():
+    with pytest.raises(ValueError):
+        create_backend("nope")
@@ -0,0 +1,32 @@
+import time
+from services.batching import MicroBatcher
+from services.cache import translation_cache
+from services.translation import TranslationService
+
+def test_full_batch_is_released_on_add():
+    batcher = MicroBatcher(max_batch_size=3, max_wait=60)
+    assert batcher.add("en-es", "a") is None
+    assert batcher.add("en-es", "b") is None
+    assert batcher.add("en-fr", "c") is None
+    assert batcher.add("en-es", "d") == ["a", "b", "d"]
+    assert len(batcher) == 1
+    assert batcher.pop_due() == []
+
+def test_batch_is_released_after_the_wait_deadline():
+    batcher = MicroBatcher(max_batch_size=10, max_wait=0.05)
+    assert batcher.next_deadline() is None
+    batcher.add("en-es", "a")
+    assert 0 < batcher.next_deadline() <= 0.05
+    assert batcher.pop_due() == []
+    time.sleep(0.06)
+    assert batcher.next_deadline() == 0
+    assert batcher.pop_due() == [("en-es", ["a"])]
+    assert len(batcher) == 0
+
+async def test_local_cache_hits_skip_the_batcher():
+    service = TranslationService()
+    key = translation_cache.make_key("cached greeting", "en", "es", service.get_model("en", "es"))
+    translation_cache.local.set(key, "saludo en cache")
+    translation, start, end = await service.translate_step("cached greeting", "en", "es")
+    assert translation == "saludo en cache" and start == end
+    assert len(service.batcher) == 0 and not service.steps
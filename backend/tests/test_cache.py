@@ -0,0 +1,41 @@
+import fakeredis.aioredis
+from prometheus_client import REGISTRY
+from services.cache import LRUCache, TranslationCache, translation_cache
+
+def evictions(reason: str) -> float:
+    return REGISTRY.get_sample_value("translation_cache_evictions_total", {"reason": reason}) or 0.0
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_size=2, ttl=60)
+    before = evictions("size")
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+    assert evictions("size") == before + 1
+
+def test_lru_expires_entries():
+    cache = LRUCache(max_size=2, ttl=-1)
+    before = evictions("expired")
+    cache.set("a", "1")
+    assert cache.get("a") is None
+    assert evictions("expired") == before + 1
+
+def test_keys_ignore_whitespace_and_include_the_model():
+    key = translation_cache.make_key("hello  world", "en", "es", "model-a")
+    assert key == translation_cache.make_key(" hello world ", "en", "es", "model-a")
+    assert key != translation_cache.make_key("hello world", "en", "es", "model-b")
+
+async def test_shared_tier_fills_the_local_tier():
+    cache = TranslationCache()
+    other = TranslationCache()
+    cache.redis_client = other.redis_client = fakeredis.aioredis.FakeRedis()
+    keys = [cache.make_key(text, "en", "es", "model-a") for text in ("hello", "goodbye")]
+    await other.set_many({keys[0]: "hola"}, "model-a")
+    assert await cache.get_many(keys) == ["hola", None]
+    assert cache.local.get(keys[0]) == "hola"
+    assert await cache.redis_client.hget(keys[0], "model") == b"model-a"
+    await cache.close()
+    assert cache.redis_client is None
@@ -0,0 +1,92 @@
+import json
+import msgpack
+import pytest
+from fastapi.testclient import TestClient
+from core.config import settings
+from main import app
+from services.processmessage import InvalidTargetError, process_message
+from services.translation import translation_service
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "RESULT_TIMEOUT", 2.0)
+    with TestClient(app) as client:
+        yield client
+
+def receive(websocket) -> dict:
+    """The next frame other than acks and system notices"""
+    while True:
+        frame = websocket.receive_text()
+        assert frame != "Processing timed out"
+        frame = json.loads(frame)
+        if frame.get("type") not in ("ack", "system"):
+            return frame
+
+def test_requested_languages():
+    assert process_message.requested_languages(None) == set()
+    assert process_message.requested_languages("fr") == {"fr"}
+    assert process_message.requested_languages(["fr", "de", "fr"]) == {"fr", "de"}
+    with pytest.raises(InvalidTargetError):
+        process_message.requested_languages({"lang": "fr"})
+    with pytest.raises(InvalidTargetError):
+        process_message.requested_languages([f"l{i}" for i in range(settings.MAX_TARGET_LANGS + 1)])
+
+def test_reachable_targets():
+    assert process_message.reachable("de")
+    assert process_message.reachable("de", "es")
+    assert not process_message.reachable("xx")
+
+def test_unreachable_target_is_refused(client):
+    with client.websocket_connect("/ws/chat/lobby?lang=es") as websocket:
+        websocket.send_json({"text": "hello", "source_lang": "en", "target_lang": ["fr", "xx"], "client_msg_id": 7})
+        frame = receive(websocket)
+        assert frame == {"type": "error", "reason": "unsupported_target", "target_lang": ["xx"], "client_msg_id": 7}
+
+def test_failed_translation_is_reported(client, monkeypatch):
+    def fail(texts, source_lang, target_lang):
+        raise RuntimeError("model unavailable")
+    monkeypatch.setattr(translation_service.backend, "translate_batch", fail)
+    with client.websocket_connect("/ws/chat/lobby?lang=es") as websocket:
+        websocket.send_json({"text": "hello", "source_lang": "en"})
+        frame = receive(websocket)
+        assert frame["type"] == "error"
+        assert frame["error"] == "translation_failed"
+        assert frame["translation_text"] is None
+
+def test_unsupported_member_language_is_refused(client):
+    with client.websocket_connect("/ws/chat/lobby?lang=xx") as websocket:
+        frame = json.loads(websocket.receive_text())
+        assert frame["reason"] == "unsupported_language"
+        assert websocket.receive()["type"] == "websocket.close"
+
+def test_unsupported_language_change_is_refused(client):
+    with client.websocket_connect("/ws/chat/lobby?lang=es") as websocket:
+        websocket.send_json({"type": "set_language", "lang": "xx"})
+        assert receive(websocket)["reason"] == "unsupported_language"
+        websocket.send_json({"text": "hello", "source_lang": "en"})
+        assert receive(websocket)["translation_text"] == "[es] hello"
+
+@pytest.mark.parametrize("text", [None, "", "   ", 42])
+def test_message_without_text_is_refused(client, text):
+    with client.websocket_connect("/ws/chat/lobby?lang=es") as websocket:
+        websocket.send_json({"text": text, "client_msg_id": 3})
+        assert receive(websocket) == {"type": "error", "reason": "invalid_text", "client_msg_id": 3}
+        websocket.send_json({"text": "hello", "source_lang": "en"})
+        assert receive(websocket)["translation_text"] == "[es] hello"
+
+def test_msgpack_batch_frame(client):
+    with client.websocket_connect("/ws/chat/lobby?lang=es", subprotocols=["msgpack"]) as websocket:
+        assert websocket.accepted_subprotocol == "msgpack"
+        websocket.send_bytes(msgpack.packb([
+            {"text": "hello", "source_lang": "en", "client_msg_id": 1},
+            {"text": "goodbye", "source_lang": "en", "client_msg_id": 2},
+        ]))
+        acks, translations = set(), set()
+        while len(translations) < 2:
+            frame = msgpack.unpackb(websocket.receive_bytes())
+            if frame.get("type") == "ack":
+                acks.add(frame["client_msg_id"])
+            elif frame.get("type") != "system":
+                translations.add(frame["translation_text"])
+        assert acks == {1, 2}
+        assert translations == {"[es] hello", "[es] goodbye"}
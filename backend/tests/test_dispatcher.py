@@ -0,0 +1,30 @@
+import asyncio
+import pytest
+from services.dispatcher import ResultDispatcher
+
+async def test_result_before_wait_is_delivered():
+    dispatcher = ResultDispatcher()
+    dispatcher.register("1-en")
+    dispatcher.resolve("1-en", "translated")
+    assert await dispatcher.wait("1-en", timeout=1) == "translated"
+    assert dispatcher.in_flight() == 0
+
+async def test_wait_times_out_and_forgets_the_request():
+    dispatcher = ResultDispatcher()
+    dispatcher.register("1-en")
+    with pytest.raises(asyncio.TimeoutError):
+        await dispatcher.wait("1-en", timeout=0.01)
+    assert not dispatcher.is_pending("1-en")
+
+async def test_discard_cancels_an_unanswered_request():
+    dispatcher = ResultDispatcher()
+    future = dispatcher.register("1-en")
+    dispatcher.discard("1-en")
+    assert future.cancelled()
+    assert dispatcher.in_flight() == 0
+
+async def test_unregistered_results_are_ignored(caplog):
+    dispatcher = ResultDispatcher()
+    dispatcher.resolve("1-en", "translated")
+    assert dispatcher.in_flight() == 0
+    assert caplog.records == []
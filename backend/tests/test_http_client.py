@@ -0,0 +1,128 @@
+import time
+import asyncio
+import httpx
+import pytest
+from core.config import settings
+from services.http_client import CircuitBreaker, CircuitOpenError, InferenceClient
+from fakes import start_inference_stub
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(settings, "INFERENCE_BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(settings, "INFERENCE_BACKOFF_MAX", 0.05)
+
+@pytest.fixture
+async def client():
+    client = InferenceClient()
+    yield client
+    await client.close()
+
+def stub(script):
+    server, template = start_inference_stub(script=script)
+    return server, template.format(src="en", tgt="es")
+
+async def test_retries_429_and_503_until_success(client):
+    server, url = stub([(429, {}, {}), (503, {}, {})])
+    try:
+        assert await client.request(url, {"inputs": ["hi"]}) == [{"translation_text": "[es] hi"}]
+        assert len(server.requests) == 3
+        assert client.breakers[url].state == "closed"
+    finally:
+        server.shutdown()
+
+async def test_gives_up_after_max_retries(client, monkeypatch):
+    monkeypatch.setattr(settings, "INFERENCE_MAX_RETRIES", 2)
+    server, url = stub([(503, {}, {})] * 3)
+    try:
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.request(url, {"inputs": ["hi"]})
+        assert len(server.requests) == 3
+        assert client.breakers[url].failures == 1
+    finally:
+        server.shutdown()
+
+async def test_client_errors_are_not_retried(client):
+    server, url = stub([(400, {}, {"error": "bad input"})])
+    try:
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.request(url, {"inputs": ["hi"]})
+        assert len(server.requests) == 1
+        assert client.breakers[url].failures == 0
+    finally:
+        server.shutdown()
+
+async def test_honours_retry_after(client):
+    server, url = stub([(429, {"Retry-After": "0.04"}, {})])
+    try:
+        started = time.monotonic()
+        await client.request(url, {"inputs": ["hi"]})
+        assert time.monotonic() - started >= 0.04
+    finally:
+        server.shutdown()
+
+def test_backoff_hints(client, monkeypatch):
+    monkeypatch.setattr(settings, "INFERENCE_BACKOFF_MAX", 5.0)
+    request = httpx.Request("POST", "http://stub")
+    retry_after = httpx.Response(429, headers={"Retry-After": "2"}, request=request)
+    loading = httpx.Response(503, json={"estimated_time": 3.5}, request=request)
+    too_long = httpx.Response(503, json={"estimated_time": 60}, request=request)
+    assert client.backoff(0, retry_after) == 2.0
+    assert client.backoff(0, loading) == 3.5
+    assert client.backoff(0, too_long) == 5.0
+    assert 0 <= client.backoff(10, None) <= 5.0
+
+async def test_breaker_opens_then_half_opens_then_closes(client, monkeypatch):
+    monkeypatch.setattr(settings, "INFERENCE_MAX_RETRIES", 0)
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(settings, "CIRCUIT_RESET_SECONDS", 0.05)
+    server, url = stub([(500, {}, {})] * 2)
+    try:
+        for _ in range(2):
+            with pytest.raises(httpx.HTTPStatusError):
+                await client.request(url, {"inputs": ["hi"]})
+        assert client.breakers[url].state == "open"
+        with pytest.raises(CircuitOpenError):
+            await client.request(url, {"inputs": ["hi"]})
+        assert len(server.requests) == 2
+        await asyncio.sleep(0.06)
+        assert client.breakers[url].state == "half-open"
+        assert await client.request(url, {"inputs": ["hi"]}) == [{"translation_text": "[es] hi"}]
+        assert client.breakers[url].state == "closed"
+    finally:
+        server.shutdown()
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.allow()
+
+async def test_undecodable_answer_still_ends_the_trial(client):
+    server, url = stub([(200, {}, b"not json")])
+    try:
+        breaker = client.breakers[url] = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+        breaker.record_failure()
+        with pytest.raises(ValueError):
+            await client.request(url, {"inputs": ["hi"]})
+        assert breaker.state == "closed"
+    finally:
+        server.shutdown()
+
+def test_abandoned_trial_lets_the_next_one_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_abandoned()
+    assert breaker.allow()
+
+async def test_close_forgets_the_breakers(client):
+    server, url = stub([])
+    try:
+        await client.request(url, {"inputs": ["hi"]})
+        await client.close()
+        assert client.breakers == {}
+    finally:
+        server.shutdown()
@@ -0,0 +1,20 @@
+import time
+import pytest
+from services.ids import IdGenerator, MAX_WORKER_ID
+
+def test_ids_are_unique_and_increasing():
+    generator = IdGenerator(worker_id=7)
+    ids = [int(generator.next_id()) for _ in range(10000)]
+    assert ids == sorted(set(ids))
+
+def test_parse_recovers_the_fields():
+    generator = IdGenerator(worker_id=42)
+    before = int(time.time() * 1000)
+    parsed = IdGenerator.parse(generator.next_id())
+    assert parsed["worker_id"] == 42
+    assert parsed["sequence"] == 0
+    assert before <= parsed["timestamp_ms"] <= int(time.time() * 1000)
+
+def test_worker_id_is_range_checked():
+    with pytest.raises(ValueError):
+        IdGenerator(MAX_WORKER_ID + 1)
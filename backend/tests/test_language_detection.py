@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+from core.messages import PipelineMessage
+from services.language_detection import LanguageDetectionService, LanguageProfile
+
+async def test_a_bad_text_fails_only_its_own_detection():
+    detection = LanguageDetectionService()
+    good, bad = await asyncio.gather(
+        detection.classify("hello there, how are you doing today?"), detection.classify(None),
+        return_exceptions=True,
+    )
+    assert good[0] == "en"
+    assert isinstance(bad, AttributeError)
+
+async def test_texts_arriving_together_share_a_batch(monkeypatch):
+    detection = LanguageDetectionService()
+    batches = []
+    detect_batch = detection.detect_batch
+    monkeypatch.setattr(detection, "detect_batch", lambda texts: batches.append(len(texts)) or detect_batch(texts))
+    results = await asyncio.gather(*(detection.classify(text) for text in ["hello there", "hola amigos", "bonjour tout le monde, comment allez-vous"]))
+    assert [language for language, _ in results] == ["en", "es", "fr"]
+    assert batches == [3]
+
+def test_profile_needs_enough_samples():
+    profile = LanguageProfile()
+    profile.learn("es")
+    profile.learn("es")
+    assert profile.language() is None
+    profile.learn("es")
+    assert profile.language() == "es"
+
+def test_profile_follows_a_language_switch():
+    profile = LanguageProfile()
+    for _ in range(5):
+        profile.learn("es")
+    profile.learn("fr")
+    assert profile.language() != "fr"
+    for _ in range(8):
+        profile.learn("fr")
+    assert profile.language() == "fr"
+
+async def test_explicit_and_profiled_sources_skip_detection(monkeypatch):
+    detection = LanguageDetectionService()
+    async def classify(text):
+        raise AssertionError("detection should be skipped")
+    monkeypatch.setattr(detection, "classify", classify)
+    assert await detection.source_language(PipelineMessage(text="hello", source_lang="fr"), None) == "fr"
+    profile = LanguageProfile()
+    for _ in range(3):
+        profile.learn("es")
+    assert await detection.source_language(PipelineMessage(text="si"), profile) == "es"
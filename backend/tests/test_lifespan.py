@@ -0,0 +1,22 @@
+import json
+from fastapi.testclient import TestClient
+from core import logs
+from core.config import settings
+from main import app
+
+def chat(client: TestClient) -> dict:
+    with client.websocket_connect("/ws/chat/lobby?lang=es") as websocket:
+        websocket.send_json({"text": "hello", "source_lang": "en", "client_msg_id": 1})
+        while True:
+            frame = websocket.receive_text()
+            assert frame != "Processing timed out"
+            frame = json.loads(frame)
+            if frame.get("type") not in ("ack", "system"):
+                return frame
+
+def test_app_can_start_again_after_shutdown(monkeypatch):
+    monkeypatch.setattr(settings, "RESULT_TIMEOUT", 2.0)
+    for _ in range(2):
+        with TestClient(app) as client:
+            assert chat(client)["translation_text"] == "[es] hello"
+            assert logs.listener is not None
@@ -0,0 +1,47 @@
+import logging
+from core.config import settings
+from core.logs import MessageRecordFilter, sampled
+from core.messages import PipelineMessage
+from services.ids import IdGenerator
+
+def record(*args, **extra) -> logging.LogRecord:
+    entry = logging.LogRecord("test", logging.DEBUG, __file__, 1, "message %s", args, None)
+    entry.__dict__.update(extra)
+    return entry
+
+def message(request_id: str) -> PipelineMessage:
+    return PipelineMessage(request_id, "lobby", "hello there", "en", "es", "hola")
+
+def test_sampling_is_decided_per_message():
+    generator = IdGenerator(worker_id=1)
+    ids = [str(generator.next_id()) for _ in range(2000)]
+    assert all(sampled(f"{message_id}-es", 1.0) for message_id in ids)
+    assert not any(sampled(f"{message_id}-es", 0.0) for message_id in ids)
+    kept = [message_id for message_id in ids if sampled(f"{message_id}-es", 0.25)]
+    assert 300 < len(kept) < 700
+    # Every target language of a sampled message is kept
+    assert all(sampled(f"{message_id}-fr", 0.25) for message_id in kept)
+
+def test_filter_drops_unsampled_message_records(monkeypatch):
+    monkeypatch.setattr(settings, "LOG_SAMPLE_RATE", 0.0)
+    record_filter = MessageRecordFilter()
+    assert not record_filter.filter(record(message("1-es")))
+    assert not record_filter.filter(record(request_id="1-es"))
+    # Records about no message are always kept
+    assert record_filter.filter(record("startup"))
+
+def test_filter_redacts_message_text(monkeypatch):
+    monkeypatch.setattr(settings, "LOG_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(settings, "LOG_REDACT_TEXT", True)
+    entry = record(message("1-es"))
+    assert MessageRecordFilter().filter(entry)
+    fields = entry.args[0]
+    assert fields["text"] == "<11 chars>" and fields["translation_text"] == "<4 chars>"
+    assert "hello there" not in entry.getMessage()
+
+def test_filter_keeps_text_unless_redacting(monkeypatch):
+    monkeypatch.setattr(settings, "LOG_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(settings, "LOG_REDACT_TEXT", False)
+    entry = record(message("1-es"))
+    assert MessageRecordFilter().filter(entry)
+    assert "hello there" in entry.getMessage()
@@ -0,0 +1,67 @@
+import threading
+from prometheus_client import REGISTRY
+from core.config import settings
+from services.backends import ModelPool
+
+MB = 1024 * 1024
+
+class FakePool(ModelPool):
+    """ModelPool whose loads take a fixed size and can be held open"""
+    def __init__(self, budget_mb: int, size_mb: int):
+        super().__init__(budget_mb)
+        self.size = size_mb * MB
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+        self.used_at_load = []
+
+    def load(self, model_name: str):
+        self.used_at_load.append(self.used())
+        self.started.set()
+        self.gate.wait(5)
+        return f"model:{model_name}", f"tokenizer:{model_name}", self.size
+
+def sample(name: str, labels=None) -> float:
+    return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+def test_evicts_before_loading(monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_MODEL_SIZE_ESTIMATE_MB", 100)
+    pool = FakePool(budget_mb=250, size_mb=100)
+    evictions = sample("translation_model_evictions_total")
+    pool.get("a")
+    pool.get("b")
+    pool.get("a")
+    pool.get("c")
+    # Room for "c" was made before it loaded: least recently used "b" went first
+    assert list(pool.models) == ["a", "c"]
+    assert pool.used_at_load[-1] <= 250 * MB - 100 * MB
+    assert sample("translation_model_evictions_total") == evictions + 1
+    assert sample("translation_model_pool_bytes", {"kind": "used"}) == 200 * MB
+    assert sample("translation_model_pool_bytes", {"kind": "budget"}) == 250 * MB
+    assert sample("translation_model_load_seconds_count", {"model": "c"}) >= 1
+
+def test_loaded_models_are_served_while_another_loads():
+    pool = FakePool(budget_mb=1000, size_mb=100)
+    pool.get("a")
+    pool.gate.clear()
+    pool.started.clear()
+    loader = threading.Thread(target=pool.get, args=("b",))
+    loader.start()
+    assert pool.started.wait(5)
+    served = []
+    reader = threading.Thread(target=lambda: served.append(pool.get("a")))
+    reader.start()
+    reader.join(1)
+    assert served == [("model:a", "tokenizer:a")]
+    pool.gate.set()
+    loader.join(5)
+    assert "b" in pool.models
+
+def test_concurrent_gets_load_a_model_once():
+    pool = FakePool(budget_mb=1000, size_mb=100)
+    threads = [threading.Thread(target=pool.get, args=("a",)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(pool.used_at_load) == 1
@@ -0,0 +1,42 @@
+import asyncio
+from core.config import settings
+from services.rooms import RoomRegistry
+
+class SlowSocket:
+    """A WebSocket whose sends block until released"""
+    def __init__(self):
+        self.sent = []
+        self.released = asyncio.Event()
+        self.closed = None
+
+    async def send_text(self, payload):
+        await self.released.wait()
+        self.sent.append(payload)
+
+    async def close(self, code=1000):
+        self.closed = code
+
+async def test_slow_member_does_not_hold_up_the_room():
+    rooms = RoomRegistry()
+    slow, fast = SlowSocket(), SlowSocket()
+    fast.released.set()
+    await rooms.join("lobby", slow, "es")
+    await rooms.join("lobby", fast, "es")
+    await asyncio.wait_for(rooms.broadcast("lobby", "es", {"n": 1}), 0.1)
+    await asyncio.sleep(0)
+    assert fast.sent == ['{"n": 1}'] and slow.sent == []
+    slow.released.set()
+    await asyncio.sleep(0)
+    assert slow.sent == ['{"n": 1}']
+
+async def test_member_too_far_behind_is_dropped(monkeypatch):
+    monkeypatch.setattr(settings, "MEMBER_OUTBOX_SIZE", 2)
+    rooms = RoomRegistry()
+    slow = SlowSocket()
+    member = await rooms.join("lobby", slow, "es")
+    for n in range(4):
+        await rooms.broadcast("lobby", "es", {"n": n})
+    await asyncio.sleep(0)
+    assert rooms.members("lobby") == []
+    assert slow.closed == 1013
+    assert member.writer.cancelled() or member.writer.done()
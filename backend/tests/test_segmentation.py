@@ -0,0 +1,52 @@
+from core.messages import PipelineMessage
+from services.processmessage import SegmentStreams
+from core.config import settings
+from services.segmentation import segmenter
+
+def segment(index: int) -> PipelineMessage:
+    return PipelineMessage("1", segments=[10, 20, 30], segment=index)
+
+def test_short_texts_are_not_segmented():
+    assert segmenter.boundaries("Hello there. How are you?") == []
+
+def test_segments_end_at_sentences():
+    text = "This is the first sentence here. " * 7 + "And the last one."
+    ends = segmenter.boundaries(text)
+    assert ends[-1] == len(text)
+    assert all(text[:end].rstrip()[-1] == "." for end in ends)
+
+def test_streams_release_segments_in_order():
+    streams = SegmentStreams()
+    assert streams.ready(segment(1)) == []
+    assert [s.segment for s in streams.ready(segment(0))] == [0, 1]
+    assert [s.segment for s in streams.ready(segment(2))] == [2]
+
+def test_streams_drop_segments_after_completion():
+    streams = SegmentStreams()
+    streams.ready(segment(0))
+    streams.complete(PipelineMessage("1", segments=[10, 20, 30]))
+    assert streams.ready(segment(1)) == []
+
+def lengths(text: str) -> list:
+    ends = segmenter.boundaries(text)
+    return [end - start for start, end in zip([0] + ends[:-1], ends)]
+
+def test_short_sentence_is_merged_into_a_word_split():
+    assert lengths("Short one. " + "y" * 500 + " end.") == [400, 116]
+
+def test_overlong_sentence_splits_between_words():
+    text = " ".join(["word"] * 200) + "."
+    pieces = lengths(text)
+    assert sum(pieces) == len(text)
+    assert all(settings.SEGMENT_MIN_CHARS <= piece <= settings.SEGMENT_MAX_CHARS for piece in pieces)
+    assert all(text[end - 1] == " " for end in segmenter.boundaries(text)[:-1])
+
+def test_sentence_of_exactly_the_maximum_is_kept_whole():
+    sentence = "x" * (settings.SEGMENT_MAX_CHARS - 2) + ". "
+    assert lengths(sentence + "The end.") == [settings.SEGMENT_MAX_CHARS, 8]
+
+def test_text_at_the_streaming_threshold():
+    text = "A sentence long enough to stand alone. " * 10
+    text = text[:settings.STREAM_MIN_CHARS]
+    assert segmenter.boundaries(text[:-1]) == []
+    assert segmenter.boundaries(text)[-1] == len(text)
@@ -0,0 +1,79 @@
+import asyncio
+import fakeredis
+import pytest
+from core.config import settings
+from core.messages import PipelineMessage
+from services.ids import IdGenerator
+from services.transport import BrokerTransport
+
+@pytest.fixture
+def broker():
+    transport = BrokerTransport()
+    transport.redis_client = fakeredis.aioredis.FakeRedis()
+    return transport
+
+def result(request_id: str) -> PipelineMessage:
+    return PipelineMessage(f"{request_id}-es", "lobby", "hello", "en", "es", "hola")
+
+async def test_backfill_starts_after_the_cursor(broker):
+    generator = IdGenerator(worker_id=1)
+    ids = [generator.next_id() for _ in range(5)]
+    for request_id in ids:
+        await broker.store_result(result(request_id))
+    history = await broker.room_history("lobby", "es", f"{ids[1]}-es")
+    assert [message.id for message in history] == [f"{request_id}-es" for request_id in ids[2:]]
+    assert await broker.room_history("lobby", "es", f"{ids[-1]}-es") == []
+
+async def test_result_stored_out_of_order_is_not_missed(broker):
+    generator = IdGenerator(worker_id=1)
+    older, newer = generator.next_id(), generator.next_id()
+    await broker.store_result(result(newer))
+    await broker.store_result(result(older))
+    history = await broker.room_history("lobby", "es", f"{newer}-es")
+    assert [message.id for message in history] == [f"{older}-es"]
+
+async def test_malformed_cursor_is_refused(broker):
+    with pytest.raises(ValueError):
+        await broker.room_history("lobby", "es", "not-an-id")
+
+async def test_presence_of_a_silent_node_expires(broker):
+    other = BrokerTransport()
+    other.node_id = "other-node"
+    other.redis_client = broker.redis_client
+    await other.set_room_languages("lobby", {"fr"})
+    await broker.set_room_languages("lobby", {"es"})
+    # As left behind by a node that stopped heartbeating
+    await broker.redis_client.hset(broker.presence_key("lobby"), other.node_id, "0|fr")
+    assert await broker.room_languages("lobby") == {"es"}
+    assert await broker.other_nodes("lobby") == []
+    assert await broker.redis_client.hkeys(broker.presence_key("lobby")) == [broker.node_id.encode()]
+
+async def test_heartbeat_keeps_presence_alive(broker, monkeypatch):
+    monkeypatch.setattr(settings, "PRESENCE_HEARTBEAT_SECONDS", 0.01)
+    await broker.set_room_languages("lobby", {"es"})
+    await broker.redis_client.hset(broker.presence_key("lobby"), broker.node_id, "0|es")
+    heartbeat = asyncio.create_task(broker.keep_presence())
+    await asyncio.sleep(0.05)
+    heartbeat.cancel()
+    assert await broker.room_languages("lobby") == {"es"}
+
+async def test_presence_is_read_once_until_it_changes(broker):
+    other = BrokerTransport()
+    other.node_id = "other-node"
+    other.redis_client = broker.redis_client
+    await other.set_room_languages("lobby", {"fr"})
+    subscriber = asyncio.create_task(broker.subscribe_results(lambda result: asyncio.sleep(0)))
+    await asyncio.sleep(0.05)
+    try:
+        assert await broker.room_languages("lobby") == {"fr"}
+        # Changed behind the node's back: the local copy is still served
+        await broker.redis_client.hset(broker.presence_key("lobby"), other.node_id, other.presence_entry({"de"}))
+        assert await broker.other_nodes("lobby") == ["other-node"]
+        assert await broker.room_languages("lobby") == {"fr"}
+        # Announced changes drop it
+        await other.set_room_languages("lobby", {"fr", "es"})
+        await asyncio.sleep(0.05)
+        assert await broker.room_languages("lobby") == {"fr", "es"}
+    finally:
+        subscriber.cancel()
+        await asyncio.gather(subscriber, return_exceptions=True)
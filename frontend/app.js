@@ -2,6 +2,8 @@ class ChatApp {
     constructor() {
         this.socket = null;
         this.roomId = 'default-room';
+        // Message id -> element of a translation still streaming in
+        this.streaming = {};
         this.initializeElements();
         this.setupEventListeners();
         this.connectWebSocket();
@@ -17,6 +19,12 @@ class ChatApp {
 
     setupEventListeners() {
         this.sendButton.addEventListener('click', () => this.sendMessage());
+        // Tell the room which language this member reads
+        this.targetLang.addEventListener('change', () => {
+            if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+                this.socket.send(JSON.stringify({ type: 'set_language', lang: this.targetLang.value }));
+            }
+        });
         this.messageInput.addEventListener('keypress', (e) => {
             if (e.key === 'Enter') {
                 this.sendMessage();
@@ -28,7 +36,11 @@ class ChatApp {
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
         const host = window.location.hostname;
         const port = '8000'; // Match your FastAPI server port
-        const wsUrl = `${protocol}//${host}:${port}/ws/chat/${this.roomId}`;
+        let wsUrl = `${protocol}//${host}:${port}/ws/chat/${this.roomId}?lang=${this.targetLang.value}`;
+        if (this.lastId) {
+            // Backfill the messages missed while disconnected
+            wsUrl += `&since=${encodeURIComponent(this.lastId)}`;
+        }
 
         this.socket = new WebSocket(wsUrl);
 
@@ -38,7 +50,14 @@ class ChatApp {
         };
 
         this.socket.onmessage = (event) => {
-            const data = JSON.parse(event.data);
+            let data;
+            try {
+                data = JSON.parse(event.data);
+            } catch (e) {
+                // Plain text notices, e.g. "Processing timed out"
+                this.addSystemMessage(event.data);
+                return;
+            }
             this.handleMessage(data);
         };
 
@@ -71,17 +90,52 @@ class ChatApp {
     }
 
     handleMessage(data) {
+        if (data.type === 'ack') {
+            // Only useful to clients matching their own message ids; nothing to show
+            return;
+        }
         if (data.type === 'system') {
             this.addSystemMessage(data.message);
+        } else if (data.type === 'busy') {
+            // Refused by admission control; the message was not sent to the room
+            this.addSystemMessage(`Server busy (${data.reason.replace(/_/g, ' ')}), try again in ${Math.ceil(data.retry_after)}s`);
+        } else if (data.type === 'error') {
+            if (data.error) {
+                // A message of the room could not be translated
+                delete this.streaming[data.id];
+                this.addSystemMessage(`Could not translate "${data.text}" into ${data.target_lang}`);
+            } else {
+                // Refused: e.g. "unsupported target: xx"
+                this.addSystemMessage(`${data.reason.replace(/_/g, ' ')}: ${[].concat(data.target_lang).join(', ')}`);
+            }
+        } else if (data.type === 'segment') {
+            // Long messages stream in sentence by sentence, in order
+            const streamed = this.streaming[data.id];
+            if (streamed) {
+                streamed.firstChild.textContent += data.text;
+                streamed.lastChild.textContent += ' ' + data.translation_text;
+                this.scrollToBottom();
+            } else {
+                this.streaming[data.id] = this.addMessage(data.text, 'received', data.translation_text);
+            }
         } else {
-            this.addMessage(data.text, 'received', data.translation);
+            if (data.id) {
+                this.lastId = data.id;
+            }
+            const streamed = this.streaming[data.id];
+            if (streamed) {
+                // The complete frame replaces the streamed segments
+                delete this.streaming[data.id];
+                streamed.remove();
+            }
+            this.addMessage(data.text, 'received', data.translation_text);
         }
     }
 
     addMessage(text, type, translation = null) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${type}`;
-        messageDiv.textContent = text;
+        messageDiv.appendChild(document.createTextNode(text));
 
         if (translation) {
             const translationDiv = document.createElement('div');
@@ -92,6 +146,7 @@ class ChatApp {
 
         this.chatMessages.appendChild(messageDiv);
         this.scrollToBottom();
+        return messageDiv;
     }
 
     addSystemMessage(message) {